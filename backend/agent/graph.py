@@ -1,18 +1,34 @@
+import asyncio
+import threading
+from functools import lru_cache
 from langgraph.graph import StateGraph, END
-from agent.state import AgentState
+from agent.state import AgentState, create_initial_state
 from agent.nodes import (
     node_analyze_spending,
     node_fetch_live_data,
     node_retrieve_knowledge,
     node_generate_roast,
-    node_generate_coach_plan
+    node_generate_coach_plan,
+    build_roast_prompt,
+    build_coach_prompt,
+    STATIC_ROAST_PROMPT,
+    STATIC_COACH_PROMPT,
+    smart_client,
+    get_inflation,
+    get_market_data,
+    ROAST_MAX_TOKENS,
+    COACH_MAX_TOKENS
 )
 
 
+@lru_cache(maxsize=1)
 def create_finsense_graph():
     """
     Creates the LangGraph agent reasoning graph.
-    Defines the flow: analyze → fetch → retrieve → roast → coach
+    Defines the flow: analyze → fetch → retrieve → (roast ∥ coach)
+    The roast and coach plan don't depend on each other, so both LLM
+    calls fan out from retrieve and run in the same superstep.
+    Compiled once — repeat calls return the same graph.
     """
     # Initialize the graph with our state schema
     graph = StateGraph(AgentState)
@@ -28,8 +44,11 @@ def create_finsense_graph():
     graph.set_entry_point("analyze_spending")
     graph.add_edge("analyze_spending", "fetch_live_data")
     graph.add_edge("fetch_live_data", "retrieve_knowledge")
+
+    # Fork — both generators run in parallel, LangGraph joins their writes
     graph.add_edge("retrieve_knowledge", "generate_roast")
-    graph.add_edge("generate_roast", "generate_coach_plan")
+    graph.add_edge("retrieve_knowledge", "generate_coach_plan")
+    graph.add_edge("generate_roast", END)
     graph.add_edge("generate_coach_plan", END)
 
     # Compile the graph
@@ -40,12 +59,107 @@ def create_finsense_graph():
 finsense_agent = create_finsense_graph()
 
 
-def run_agent(budget_input: dict) -> AgentState:
+def _warm_start():
+    """
+    Imports the RAG retriever (ChromaDB) and loads the embedding model so
+    the first request doesn't pay for it. Then prefetches inflation and
+    market data for both countries, which also sets up yfinance's Yahoo
+    session, so the first user is served from the tool caches.
+    """
+    try:
+        import rag.retriever  # noqa: F401
+        from rag._embedder import get_embedder
+        get_embedder()
+    except Exception as e:
+        print(f"  ⚠️ Retriever warm-up failed ({e}) — it will load on first request")
+
+    for country in ("india", "us"):
+        for prefetch in (get_inflation, get_market_data):
+            try:
+                prefetch(country)
+            except Exception as e:
+                print(f"  ⚠️ {prefetch.__name__}({country}) prefetch failed ({e}) — it will fetch on first request")
+
+
+def warm_start() -> threading.Thread:
+    """
+    Starts the warm-up in a background thread — call it once from server
+    startup. It runs alongside the server accepting traffic; an early
+    request that needs the retriever simply waits on the same import.
+    Importing this module alone does no network I/O.
+    """
+    thread = threading.Thread(target=_warm_start, name="finsense-warm-start", daemon=True)
+    thread.start()
+    return thread
+
+
+async def arun_agent(budget_input: dict) -> AgentState:
     """
     Runs the full agent pipeline on a budget input.
     Returns the complete state with all results.
+    Await this from async servers instead of calling run_agent().
     """
-    from agent.state import create_initial_state
     initial_state = create_initial_state(budget_input)
-    final_state = finsense_agent.invoke(initial_state)
-    return final_state
\ No newline at end of file
+    return await finsense_agent.ainvoke(initial_state)
+
+
+def run_agent(budget_input: dict) -> AgentState:
+    """Blocking wrapper around arun_agent() for scripts and tests."""
+    return asyncio.run(arun_agent(budget_input))
+
+
+async def stream_agent(budget_input: dict):
+    """
+    Runs the pipeline and yields events as they happen, for the
+    frontend's SSE stream:
+        {"type": "token", "node": ..., "text": ...}  LLM output as it streams
+        {"type": "step", ...}                        each completed step
+        {"type": "result", "state": ...}             the final state
+    """
+    initial_state = create_initial_state(budget_input)
+    final_state = initial_state
+    seen_steps = 0
+
+    async for mode, chunk in finsense_agent.astream(initial_state, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            yield {"type": "token", **chunk}
+            continue
+
+        final_state = chunk
+        steps = chunk.get("steps", [])
+        for step in steps[seen_steps:]:
+            yield {"type": "step", **step}
+        seen_steps = len(steps)
+
+    yield {"type": "result", "state": final_state}
+
+
+def run_agent_batch(budget_inputs: list) -> list:
+    """
+    Runs the pipeline for many users at once, for offline jobs such as
+    evaluation runs or precomputing plans.
+    Every roast and coach plan goes out in one Gemini batch job instead
+    of 2N synchronous LLM calls. Returns one final state per input.
+    """
+    initial_states = [create_initial_state(b, batch_mode=True) for b in budget_inputs]
+
+    async def run_all():
+        return await asyncio.gather(*[finsense_agent.ainvoke(s) for s in initial_states])
+
+    final_states = asyncio.run(run_all())
+
+    prompts = {}
+    for i, state in enumerate(final_states):
+        prompts[f"{i}-roast"] = (STATIC_ROAST_PROMPT, build_roast_prompt(state), ROAST_MAX_TOKENS)
+        prompts[f"{i}-coach"] = (STATIC_COACH_PROMPT, build_coach_prompt(state), COACH_MAX_TOKENS)
+
+    outputs = smart_client.generate_batch(prompts)
+
+    return [
+        {
+            **state,
+            "roast": outputs.get(f"{i}-roast", ""),
+            "coach_plan": outputs.get(f"{i}-coach", "")
+        }
+        for i, state in enumerate(final_states)
+    ]
@@ -1,32 +1,103 @@
 import sys
 import os
+import asyncio
+import json
+import tempfile
+from dataclasses import asdict
+from operator import itemgetter
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
-from datetime import datetime
 import time
 
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
 # Add backend to path so we can import our modules
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+from config import GROQ_API_KEY, GEMINI_API_KEY
 from agent.state import AgentState
 from mcp_tools.market_data import get_market_data
 from mcp_tools.inflation import get_inflation
 from mcp_tools.news import get_financial_news
 from mcp_tools.calculator import generate_projections
 from mcp_tools.tax_estimator import get_tax_estimate
+from mcp_tools._cache import ttl_cached
 from ml.anomaly_detector import detect_anomalies
 from ml.health_score import compute_health_score
 
-from groq import Groq
+import httpx
+from groq import Groq, AsyncGroq
+from groq import APIError as GroqAPIError, APIConnectionError as GroqConnectionError
+from groq import RateLimitError as GroqRateLimitError
 from google import genai
+from google.genai.errors import APIError as GeminiAPIError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from langgraph.config import get_stream_writer
+
+# ── Tool Response Caches ─────────────────────────────────────────────────────
+# Inputs are low-cardinality (two countries) and the data changes slowly,
+# so repeat requests are served from memory instead of re-hitting the APIs.
+# The tax estimate is local arithmetic on the exact income — not cached.
+
+get_inflation = ttl_cached(ttl=24 * 60 * 60)(get_inflation)      # monthly CPI
+get_market_data = ttl_cached(ttl=5 * 60)(get_market_data)        # live prices
+get_financial_news = ttl_cached(ttl=30 * 60)(get_financial_news)  # headlines
 
 # ── Smart LLM Client — Groq primary, Gemini fallback ─────────────────────────
 
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Gemini service tiers — priority for interactive calls, flex is ~50% cheaper
+# but may take minutes. "standard" sends no tier and uses the default.
+GEMINI_SERVICE_TIERS = {"priority": "PRIORITY", "flex": "FLEX"}
+
+# How long a cached static prompt lives on Gemini before it is recreated
+PROMPT_CACHE_TTL_SECONDS = 3600
+
+# Terminal states of a Gemini batch job
+BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"
+}
+
+QUOTA_EXCEEDED_MESSAGE = "Unable to generate response — quota exceeded. Please try again in a few minutes."
+
+# Anything Gemini can fail with — API errors plus raw network faults
+GEMINI_ERRORS = (GeminiAPIError, httpx.TransportError)
+
+# Dropped connections and timeouts — retry quickly before giving up
+retry_transient = retry(
+    retry=retry_if_exception_type((GroqConnectionError, httpx.TransportError)),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.5, max=4),
+    reraise=True
+)
+
+# Both providers out of quota — back off before the last Groq attempts
+retry_quota = retry(
+    retry=retry_if_exception_type(GroqRateLimitError),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=5, max=60),
+    reraise=True
+)
+
+
+# ── Provider Clients ─────────────────────────────────────────────────────────
+# Created on first use, one per process — importing the module opens no
+# connections, and every SmartLLMClient shares the same connection pools.
+
+@lru_cache(maxsize=1)
+def get_groq_client() -> Groq:
+    return Groq(api_key=GROQ_API_KEY)
+
+
+@lru_cache(maxsize=1)
+def get_groq_async_client() -> AsyncGroq:
+    return AsyncGroq(api_key=GROQ_API_KEY)
+
+
+@lru_cache(maxsize=1)
+def get_gemini_client() -> genai.Client:
+    return genai.Client(api_key=GEMINI_API_KEY)
 
 
 class SmartLLMClient:
@@ -36,51 +107,399 @@ class SmartLLMClient:
     This ensures the app never goes down due to quota issues.
     """
 
-    def generate(self, prompt: str, max_tokens: int = 1000) -> str:
-        # ── Try Groq first ───────────────────────────────────────────────────
+    def __init__(self):
+        # static system prompt → (Gemini cache name or None, expiry time)
+        self._prompt_caches = {}
+
+    @property
+    def groq(self) -> Groq:
+        return get_groq_client()
+
+    @property
+    def groq_async(self) -> AsyncGroq:
+        return get_groq_async_client()
+
+    @property
+    def gemini(self) -> genai.Client:
+        return get_gemini_client()
+
+    def _cached_prompt(self, system: str):
+        """
+        Returns a Gemini cached-content name for a static system prompt,
+        creating it on first use and again once the TTL runs out.
+        Returns None when Gemini refuses the cache (e.g. the prompt is
+        under the minimum cacheable size) — the caller then sends it inline.
+        """
+        cache_name, expires_at = self._prompt_caches.get(system, (None, 0))
+        if time.time() < expires_at:
+            return cache_name
+
         try:
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=0.7
+            cache = self.gemini.caches.create(
+                model=GEMINI_MODEL,
+                config={
+                    "system_instruction": system,
+                    "ttl": f"{PROMPT_CACHE_TTL_SECONDS}s"
+                }
             )
-            return response.choices[0].message.content
+            cache_name = cache.name
+        except GEMINI_ERRORS as e:
+            print(f"  ⚠️ Gemini prompt cache unavailable ({e}) — sending prompt inline")
+            cache_name = None
+
+        # Refresh a minute early so we never reference an expired cache
+        self._prompt_caches[system] = (cache_name, time.time() + PROMPT_CACHE_TTL_SECONDS - 60)
+        return cache_name
+
+    def _gemini_config(self, tier: str, system: str = None):
+        """Builds the Gemini request config — service tier plus cached system prompt."""
+        config = {}
+        service_tier = GEMINI_SERVICE_TIERS.get(tier)
+        if service_tier:
+            config["service_tier"] = service_tier
+        if system:
+            cache_name = self._cached_prompt(system)
+            if cache_name:
+                config["cached_content"] = cache_name
+            else:
+                config["system_instruction"] = system
+        return config or None
+
+    def _groq_messages(self, prompt: str, system: str = None) -> list:
+        """Builds the Groq chat messages — static system prompt first."""
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        return messages
+
+    @retry_transient
+    def _generate_groq(self, prompt: str, max_tokens: int, system: str = None) -> str:
+        """Calls Groq, retrying dropped connections and timeouts."""
+        response = self.groq.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=self._groq_messages(prompt, system),
+            max_tokens=max_tokens,
+            temperature=0.7
+        )
+        return response.choices[0].message.content
+
+    @retry_transient
+    def _generate_gemini(self, prompt: str, tier: str, system: str = None) -> str:
+        """Calls Gemini on the requested service tier, reusing the cached system prompt."""
+        gemini_response = self.gemini.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=self._gemini_config(tier, system)
+        )
+        return gemini_response.text
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        tier: str = "standard",
+        system: str = None
+    ) -> str:
+        """
+        Generates a completion on the requested tier.
+        "priority" — user-facing calls, Groq first then Gemini priority.
+        "flex" — calls that can wait, sent straight to Gemini flex since
+        Groq has no cheaper tier. Falls back to Groq if flex fails.
+        system is the static part of the prompt — cached on Gemini so
+        only the per-user prompt is reprocessed on each call.
+        """
+        # ── Flex goes to Gemini directly ─────────────────────────────────────
+        if tier == "flex":
+            try:
+                return self._generate_gemini(prompt, tier, system)
+            except GEMINI_ERRORS as e:
+                print(f"  ⚠️ Gemini flex failed ({e}) — falling back to Groq...")
+                tier = "standard"
 
-        except Exception as e:
-            error_str = str(e)
+        # ── Try Groq first ───────────────────────────────────────────────────
+        try:
+            return self._generate_groq(prompt, max_tokens, system)
+        except GroqRateLimitError:
+            print("  ⚠️ Groq quota hit — falling back to Gemini...")
 
-            if "429" in error_str or "rate" in error_str.lower() or "quota" in error_str.lower():
-                print("  ⚠️ Groq quota hit — falling back to Gemini...")
-                time.sleep(2)
+        # ── Fall back to Gemini ──────────────────────────────────────────────
+        try:
+            return self._generate_gemini(prompt, tier, system)
+        except GeminiAPIError as e:
+            if e.code != 429:
+                raise
 
-                # ── Fall back to Gemini ──────────────────────────────────────
+        # ── Both out of quota — back off and retry Groq ──────────────────────
+        print("  ⚠️ Gemini quota hit too — backing off before retrying Groq...")
+        try:
+            return retry_quota(self._generate_groq)(prompt, max_tokens, system)
+        except GroqRateLimitError:
+            return QUOTA_EXCEEDED_MESSAGE
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        tier: str = "standard",
+        system: str = None
+    ):
+        """
+        Yields the completion chunk by chunk so the user sees text as soon
+        as the first tokens arrive. Same routing as generate() — Groq first,
+        Gemini first for flex. If neither stream can be opened, or one drops
+        before any text arrives, falls back to the blocking generate() with
+        its full retry logic. A stream that drops later keeps its partial text.
+        """
+        # ── Try Groq first ───────────────────────────────────────────────────
+        if tier != "flex":
+            try:
+                stream = self.groq.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=self._groq_messages(prompt, system),
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    stream=True
+                )
+            except GroqAPIError as e:
+                print(f"  ⚠️ Groq stream unavailable ({e}) — falling back to Gemini...")
+            else:
+                yielded = False
+                try:
+                    for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yielded = True
+                            yield chunk.choices[0].delta.content
+                except GroqAPIError as e:
+                    # Dropped mid-response — keep the partial text, or fall
+                    # back to the full response if nothing arrived yet
+                    if yielded:
+                        print(f"  ⚠️ Groq stream dropped ({e}) — keeping the partial response")
+                        return
+                    print(f"  ⚠️ Groq stream dropped ({e}) — waiting for full response...")
+                    yield self.generate(prompt, max_tokens, tier, system)
+                return
+
+        # ── Gemini stream ────────────────────────────────────────────────────
+        # The stream is lazy — errors surface on the first chunk, so pull it
+        # before yielding anything to keep the fallback clean
+        try:
+            stream = iter(self.gemini.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=self._gemini_config(tier, system)
+            ))
+            first = next(stream, None)
+        except GEMINI_ERRORS as e:
+            print(f"  ⚠️ Gemini stream unavailable ({e}) — waiting for full response...")
+            yield self.generate(prompt, max_tokens, tier, system)
+            return
+
+        yielded = first is not None and bool(first.text)
+        if yielded:
+            yield first.text
+        try:
+            for chunk in stream:
+                if chunk.text:
+                    yielded = True
+                    yield chunk.text
+        except GEMINI_ERRORS as e:
+            if yielded:
+                print(f"  ⚠️ Gemini stream dropped ({e}) — keeping the partial response")
+                return
+            print(f"  ⚠️ Gemini stream dropped ({e}) — waiting for full response...")
+            yield self.generate(prompt, max_tokens, tier, system)
+
+    # ── Async API — used by the graph nodes so LLM I/O never blocks the loop ─
+
+    @retry_transient
+    async def _agenerate_groq(self, prompt: str, max_tokens: int, system: str = None) -> str:
+        """Async Groq call, retrying dropped connections and timeouts."""
+        response = await self.groq_async.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=self._groq_messages(prompt, system),
+            max_tokens=max_tokens,
+            temperature=0.7
+        )
+        return response.choices[0].message.content
+
+    @retry_transient
+    async def _agenerate_gemini(self, prompt: str, tier: str, system: str = None) -> str:
+        """Async Gemini call. The config lookup may create a prompt cache, so it runs in a thread."""
+        config = await asyncio.to_thread(self._gemini_config, tier, system)
+        gemini_response = await self.gemini.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=config
+        )
+        return gemini_response.text
+
+    async def agenerate(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        tier: str = "standard",
+        system: str = None
+    ) -> str:
+        """Async version of generate() — same routing and fallbacks."""
+        # ── Flex goes to Gemini directly ─────────────────────────────────────
+        if tier == "flex":
+            try:
+                return await self._agenerate_gemini(prompt, tier, system)
+            except GEMINI_ERRORS as e:
+                print(f"  ⚠️ Gemini flex failed ({e}) — falling back to Groq...")
+                tier = "standard"
+
+        # ── Try Groq first ───────────────────────────────────────────────────
+        try:
+            return await self._agenerate_groq(prompt, max_tokens, system)
+        except GroqRateLimitError:
+            print("  ⚠️ Groq quota hit — falling back to Gemini...")
+
+        # ── Fall back to Gemini ──────────────────────────────────────────────
+        try:
+            return await self._agenerate_gemini(prompt, tier, system)
+        except GeminiAPIError as e:
+            if e.code != 429:
+                raise
+
+        # ── Both out of quota — back off and retry Groq ──────────────────────
+        print("  ⚠️ Gemini quota hit too — backing off before retrying Groq...")
+        try:
+            return await retry_quota(self._agenerate_groq)(prompt, max_tokens, system)
+        except GroqRateLimitError:
+            return QUOTA_EXCEEDED_MESSAGE
+
+    async def agenerate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        tier: str = "standard",
+        system: str = None
+    ):
+        """Async version of generate_stream() — same routing and fallbacks."""
+        # ── Try Groq first ───────────────────────────────────────────────────
+        if tier != "flex":
+            try:
+                stream = await self.groq_async.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=self._groq_messages(prompt, system),
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    stream=True
+                )
+            except GroqAPIError as e:
+                print(f"  ⚠️ Groq stream unavailable ({e}) — falling back to Gemini...")
+            else:
+                yielded = False
                 try:
-                    gemini_response = gemini_client.models.generate_content(
-                        model="gemini-2.0-flash",
-                        contents=prompt
-                    )
-                    return gemini_response.text
-
-                except Exception as gemini_error:
-                    gemini_error_str = str(gemini_error)
-                    if "429" in gemini_error_str or "RESOURCE_EXHAUSTED" in gemini_error_str:
-                        print("  ⚠️ Gemini quota hit too — waiting 60 seconds...")
-                        time.sleep(60)
-                        # One final retry with Groq
-                        try:
-                            retry_response = groq_client.chat.completions.create(
-                                model="llama-3.3-70b-versatile",
-                                messages=[{"role": "user", "content": prompt}],
-                                max_tokens=max_tokens,
-                                temperature=0.7
-                            )
-                            return retry_response.choices[0].message.content
-                        except Exception:
-                            return "Unable to generate response — quota exceeded. Please try again in a few minutes."
-                    raise gemini_error
-
-            raise e
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yielded = True
+                            yield chunk.choices[0].delta.content
+                except GroqAPIError as e:
+                    # Dropped mid-response — keep the partial text, or fall
+                    # back to the full response if nothing arrived yet
+                    if yielded:
+                        print(f"  ⚠️ Groq stream dropped ({e}) — keeping the partial response")
+                        return
+                    print(f"  ⚠️ Groq stream dropped ({e}) — waiting for full response...")
+                    yield await self.agenerate(prompt, max_tokens, tier, system)
+                return
+
+        # ── Gemini stream ────────────────────────────────────────────────────
+        # Pull the first chunk before yielding anything to keep the fallback clean
+        try:
+            config = await asyncio.to_thread(self._gemini_config, tier, system)
+            stream = await self.gemini.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=config
+            )
+            first = await anext(stream, None)
+        except GEMINI_ERRORS as e:
+            print(f"  ⚠️ Gemini stream unavailable ({e}) — waiting for full response...")
+            yield await self.agenerate(prompt, max_tokens, tier, system)
+            return
+
+        yielded = first is not None and bool(first.text)
+        if yielded:
+            yield first.text
+        try:
+            async for chunk in stream:
+                if chunk.text:
+                    yielded = True
+                    yield chunk.text
+        except GEMINI_ERRORS as e:
+            if yielded:
+                print(f"  ⚠️ Gemini stream dropped ({e}) — keeping the partial response")
+                return
+            print(f"  ⚠️ Gemini stream dropped ({e}) — waiting for full response...")
+            yield await self.agenerate(prompt, max_tokens, tier, system)
+
+    def generate_batch(self, prompts: dict, poll_seconds: int = 30) -> dict:
+        """
+        Submits many prompts as a single Gemini Batch API job.
+        Half the price of synchronous calls and outside the interactive
+        quota, but jobs can take up to 24 hours — offline use only.
+
+        Args:
+            prompts: {key: (system, prompt, max_tokens)}
+            poll_seconds: How often to check the job status
+
+        Returns:
+            {key: generated text}
+        """
+        lines = [
+            json.dumps({
+                "key": key,
+                "request": {
+                    "system_instruction": {"parts": [{"text": system}]},
+                    "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                    "generation_config": {"max_output_tokens": max_tokens}
+                }
+            })
+            for key, (system, prompt, max_tokens) in prompts.items()
+        ]
+
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+            f.write("\n".join(lines))
+            jsonl_path = f.name
+
+        try:
+            uploaded = self.gemini.files.upload(
+                file=jsonl_path,
+                config={"display_name": "finsense-batch", "mime_type": "jsonl"}
+            )
+        finally:
+            os.remove(jsonl_path)
+
+        batch_job = self.gemini.batches.create(
+            model=GEMINI_MODEL,
+            src=uploaded.name,
+            config={"display_name": "finsense-batch"}
+        )
+        print(f"  Submitted batch job {batch_job.name} with {len(prompts)} prompts")
+
+        while batch_job.state.name not in BATCH_DONE_STATES:
+            time.sleep(poll_seconds)
+            batch_job = self.gemini.batches.get(name=batch_job.name)
+
+        if batch_job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Batch job {batch_job.name} ended with {batch_job.state.name}")
+
+        raw = self.gemini.files.download(file=batch_job.dest.file_name).decode("utf-8")
+
+        results = {}
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            try:
+                parts = item["response"]["candidates"][0]["content"]["parts"]
+                results[item["key"]] = "".join(part.get("text", "") for part in parts)
+            except (KeyError, IndexError):
+                results[item["key"]] = "Unable to generate response — batch request failed."
+        return results
 
 
 # Single instance used across all nodes
@@ -88,16 +507,31 @@ smart_client = SmartLLMClient()
 
 
 def add_step(state: AgentState, step_name: str, detail: str = "") -> list:
-    """Helper to add a reasoning step to the state."""
-    steps = state.get("steps", [])
-    steps.append({
-        "step_number": len(steps) + 1,
+    """
+    Helper to build a reasoning step for the state.
+    Returns only the new step — the merge_steps reducer appends and numbers it.
+    Steps carry milliseconds since the run started (state["timestamp"] has
+    the wall-clock start), which is all the frontend needs for ordering.
+    """
+    return [{
         "step_name": step_name,
         "detail": detail,
-        "timestamp": datetime.now().isoformat(),
+        "elapsed_ms": int((time.monotonic() - state["started_monotonic"]) * 1000),
         "status": "complete"
-    })
-    return steps
+    }]
+
+
+async def stream_to_writer(node: str, chunks) -> str:
+    """
+    Forwards LLM chunks to LangGraph's custom stream as they arrive and
+    returns the full text for the state. A no-op writer outside streaming.
+    """
+    writer = get_stream_writer()
+    parts = []
+    async for text in chunks:
+        parts.append(text)
+        writer({"node": node, "text": text})
+    return "".join(parts)
 
 
 # ── Node 1: Analyze Spending ─────────────────────────────────────────────────
@@ -112,18 +546,30 @@ def node_analyze_spending(state: AgentState) -> AgentState:
     monthly_income = state["monthly_income"]
     country = state["country"]
 
-    anomalies = detect_anomalies(spending, monthly_income, country)
-    health_result = compute_health_score(spending, monthly_income, anomalies, country)
+    rows = detect_anomalies(spending, monthly_income, country)
+    health_result = compute_health_score(spending, monthly_income, rows, country)
+
+    # The state holds plain dicts, so it stays JSON-serializable for the
+    # SSE stream and the API response
+    anomalies = [asdict(row) for row in rows]
+
+    # Filtered and ranked once here — downstream nodes just slice it.
+    # A lower anomaly_score means more anomalous, so ascending puts the worst first
+    anomalies_sorted = sorted(
+        (a for a in anomalies if a["is_anomalous"]),
+        key=itemgetter("anomaly_score")
+    )
 
     steps = add_step(
         state,
         "Analyzing spending patterns",
-        f"Found {len([a for a in anomalies if a['is_anomalous']])} anomalies in your budget"
+        f"Found {len(anomalies_sorted)} anomalies in your budget"
     )
 
+    # Partial update — LangGraph merges returned keys into the state
     return {
-        **state,
         "anomalies": anomalies,
+        "anomalies_sorted": anomalies_sorted,
         "health_score": health_result["score"],
         "health_grade": health_result["grade"],
         "steps": steps
@@ -131,10 +577,12 @@ def node_analyze_spending(state: AgentState) -> AgentState:
 
 
 # ── Node 2: Fetch Live Data ──────────────────────────────────────────────────
-def node_fetch_live_data(state: AgentState) -> AgentState:
+async def node_fetch_live_data(state: AgentState) -> AgentState:
     """
     Calls all MCP tools to fetch real-world data.
     Inflation rate, market prices, news, tax estimate.
+    The network-bound tools run concurrently, so this node takes as long
+    as the slowest API instead of the sum of all of them.
     """
     print("Node 2: Fetching live data...")
 
@@ -142,17 +590,21 @@ def node_fetch_live_data(state: AgentState) -> AgentState:
     monthly_income = state["monthly_income"]
     annual_income = monthly_income * 12
 
-    inflation_data = get_inflation(country)
-    market_data = get_market_data(country)
-    news_articles = get_financial_news(country, max_articles=5)
-    tax_estimate = get_tax_estimate(country, annual_income)
-
     spending = state["spending"]
     total_spending = sum(v for k, v in spending.items()
                         if k not in ["savings", "investments"])
     investable_amount = max(0, monthly_income - total_spending)
+
+    # Tax and projections are local arithmetic — only the API calls need threads
+    tax_estimate = get_tax_estimate(country, annual_income)
     projections = generate_projections(investable_amount, country)
 
+    inflation_data, market_data, news_articles = await asyncio.gather(
+        asyncio.to_thread(get_inflation, country),
+        asyncio.to_thread(get_market_data, country),
+        asyncio.to_thread(get_financial_news, country, max_articles=5),
+    )
+
     steps = add_step(
         state,
         "Fetching live market and economic data",
@@ -161,7 +613,6 @@ def node_fetch_live_data(state: AgentState) -> AgentState:
     )
 
     return {
-        **state,
         "inflation_data": inflation_data,
         "market_data": market_data,
         "news_articles": news_articles.get("articles", []),
@@ -180,13 +631,13 @@ def node_retrieve_knowledge(state: AgentState) -> AgentState:
 
     try:
         from rag.retriever import retrieve_knowledge
-        anomalies = state["anomalies"]
         country = state["country"]
 
-        anomalous = [a for a in anomalies if a["is_anomalous"]]
-        if anomalous:
-            worst = sorted(anomalous, key=lambda x: x["anomaly_score"], reverse=True)[:3]
-            query = f"budgeting advice for overspending on {', '.join([a['category'] for a in worst])}"
+        worst = state["anomalies_sorted"][:3]
+        if worst:
+            # Alphabetical so the same categories always build the same (cacheable) query
+            categories = sorted(a["category"] for a in worst)
+            query = f"budgeting advice for overspending on {', '.join(categories)}"
         else:
             query = f"general budgeting and investing advice for {country}"
 
@@ -198,52 +649,35 @@ def node_retrieve_knowledge(state: AgentState) -> AgentState:
             f"Found {len(knowledge)} relevant passages from trusted sources"
         )
 
-        return {**state, "retrieved_knowledge": knowledge, "steps": steps}
+        return {"retrieved_knowledge": knowledge, "steps": steps}
 
     except Exception as e:
         steps = add_step(state, "Knowledge retrieval", f"Error: {str(e)}")
-        return {**state, "retrieved_knowledge": [], "steps": steps}
+        return {"retrieved_knowledge": [], "steps": steps}
 
 
-# ── Node 4: Generate Roast ───────────────────────────────────────────────────
-def node_generate_roast(state: AgentState) -> AgentState:
-    """
-    Uses LLM to generate a brutally honest, funny roast
-    based on the user's actual spending anomalies and data.
-    """
-    print("Node 4: Generating roast...")
+# ── Prompt Builders ──────────────────────────────────────────────────────────
+# Shared by the live generation nodes and the offline batch runner.
+# Each prompt is a static system block (identical for every user, so Gemini
+# can cache it) plus a small per-user block with the actual numbers.
 
-    country = state["country"]
-    monthly_income = state["monthly_income"]
-    spending = state["spending"]
-    anomalies = state["anomalies"]
-    health_score = state["health_score"]
-    inflation_rate = state["inflation_data"].get("inflation_rate", "N/A")
-    language = state["language"]
-    currency = "₹" if country == "india" else "$"
-
-    anomalous = [a for a in anomalies if a["is_anomalous"]]
-    anomaly_text = "\n".join([
-        f"- {a['category']}: {currency}{a['amount']:,}/month "
-        f"({a['percentage_of_income']}% of income, benchmark is {a['benchmark_percentage']}%)"
-        for a in anomalous
-    ]) if anomalous else "No major anomalies found"
+ROAST_MAX_TOKENS = 500
+COACH_MAX_TOKENS = 800
 
-    hinglish_instruction = "Write in Hinglish (mix of Hindi and English, casual tone)" if language == "hinglish" else "Write in English"
+# RAG context sent with the coach prompt — ~40 words is roughly 50 tokens
+KNOWLEDGE_PASSAGES = 3
+KNOWLEDGE_WORDS_PER_PASSAGE = 40
 
-    prompt = f"""You are a brutally honest financial advisor who roasts people's budgets.
-Be specific, funny, and harsh but not mean-spirited. Reference their actual numbers.
-
-User's Financial Profile:
-- Country: {country.upper()}
-- Monthly Income: {currency}{monthly_income:,}
-- Financial Health Score: {health_score}/100
-- Current Inflation Rate: {inflation_rate}%
+CURRENCY = {"india": "₹", "us": "$"}
 
-Problematic Spending:
-{anomaly_text}
+# country → (needs, wants, savings & investments, framework name)
+BUDGET_FRAMEWORKS = {
+    "india": (0.40, 0.30, 0.30, "40/30/30"),
+    "us":    (0.50, 0.30, 0.20, "50/30/20"),
+}
 
-{hinglish_instruction}
+STATIC_ROAST_PROMPT = """You are a brutally honest financial advisor who roasts people's budgets.
+Be specific, funny, and harsh but not mean-spirited. Reference their actual numbers.
 
 Write a roast (150-200 words) that:
 1. Opens with a punchy one-liner about their overall financial situation
@@ -253,91 +687,179 @@ Write a roast (150-200 words) that:
 
 Be specific to their numbers. Do not be generic."""
 
-    roast = smart_client.generate(prompt, max_tokens=500)
+STATIC_COACH_PROMPT = """You are a certified financial planner giving serious, actionable advice.
 
-    steps = add_step(state, "Generating your financial roast", "Roast generated successfully")
-
-    return {**state, "roast": roast, "steps": steps}
+Write a Coach Plan (250-300 words) with these sections:
+1. **Budget Rebuild** — show the breakdown of their budget framework with their actual income
+2. **Top 3 Actions** — specific, numbered steps to take this week
+3. **Investing Starter Plan** — where to start, how much, why
+4. **The 10-Year Picture** — what disciplined investing looks like for them
 
+Be specific with numbers. Cite the framework. Make it feel achievable."""
 
-# ── Node 5: Generate Coach Plan ──────────────────────────────────────────────
-def node_generate_coach_plan(state: AgentState) -> AgentState:
-    """
-    Generates a serious, actionable financial coach plan.
-    """
-    print("Node 5: Generating coach plan...")
 
-    country = state["country"]
-    monthly_income = state["monthly_income"]
-    spending = state["spending"]
-    anomalies = state["anomalies"]
-    inflation_rate = state["inflation_data"].get("inflation_rate", "N/A")
-    tax_tip = state["tax_estimate"].get("tip", "")
-    projections = state["projections"]
-    knowledge = state["retrieved_knowledge"]
-    currency = "₹" if country == "india" else "$"
-    framework = "40/30/30" if country == "india" else "50/30/20"
-
-    proj_data = projections.get("projections", {})
-    proj_summary = "\n".join([
-        f"- {k.replace('_', ' ').title()}: {currency}{v.get('future_value', 0):,.0f}"
-        for k, v in proj_data.items()
-    ]) if proj_data else "Projections unavailable"
+# Per-user blocks — filled with str.format_map from a dict built once per call
+ROAST_TEMPLATE = """User's Financial Profile:
+- Country: {country_upper}
+- Monthly Income: {currency}{monthly_income:,}
+- Financial Health Score: {health_score}/100
+- Current Inflation Rate: {inflation_rate}%
 
-    knowledge_context = "\n".join([
-        f"- {k.get('content', '')[:200]}"
-        for k in knowledge[:3]
-    ]) if knowledge else ""
+Problematic Spending:
+{anomaly_block}
 
-    prompt = f"""You are a certified financial planner giving serious, actionable advice.
+{language_instruction}"""
 
-User Profile:
-- Country: {country.upper()}
+COACH_TEMPLATE = """User Profile:
+- Country: {country_upper}
 - Monthly Income: {currency}{monthly_income:,}
 - Current Inflation: {inflation_rate}%
 - Budget Framework: {framework} rule
 
 Current Spending:
-{chr(10).join([f'- {k}: {currency}{v:,}' for k, v in spending.items()])}
+{spending_block}
 
 If they invest their surplus monthly:
-{proj_summary}
+{projection_block}
 
 Tax Tip: {tax_tip}
 
 Financial Knowledge Context:
-{knowledge_context}
+{knowledge_block}"""
 
-Write a Coach Plan (250-300 words) with these sections:
-1. **Budget Rebuild** — show the {framework} breakdown with their actual income
-2. **Top 3 Actions** — specific, numbered steps to take this week
-3. **Investing Starter Plan** — where to start, how much, why
-4. **The 10-Year Picture** — what disciplined investing looks like for them
+LANGUAGE_INSTRUCTIONS = {
+    "hinglish": "Write in Hinglish (mix of Hindi and English, casual tone)",
+    "english": "Write in English",
+}
 
-Be specific with numbers. Cite the framework. Make it feel achievable."""
 
-    coach_plan = smart_client.generate(prompt, max_tokens=800)
-
-    if country == "india":
-        rebuilt_budget = {
-            "needs": round(monthly_income * 0.40, 2),
-            "wants": round(monthly_income * 0.30, 2),
-            "savings_investments": round(monthly_income * 0.30, 2),
-            "framework": "40/30/30"
-        }
-    else:
-        rebuilt_budget = {
-            "needs": round(monthly_income * 0.50, 2),
-            "wants": round(monthly_income * 0.30, 2),
-            "savings_investments": round(monthly_income * 0.20, 2),
-            "framework": "50/30/20"
-        }
+def build_roast_prompt(state: AgentState) -> str:
+    """Builds the per-user roast block from anomalies and health score."""
+    country = state["country"]
+    currency = CURRENCY.get(country, "$")
+
+    anomaly_block = "\n".join(
+        f"- {a['category']}: {currency}{a['amount']:,}/month "
+        f"({a['percentage_of_income']}% of income, benchmark is {a['benchmark_percentage']}%)"
+        for a in state["anomalies_sorted"]
+    ) or "No major anomalies found"
+
+    return ROAST_TEMPLATE.format_map({
+        "country_upper": country.upper(),
+        "currency": currency,
+        "monthly_income": state["monthly_income"],
+        "health_score": state["health_score"],
+        "inflation_rate": state["inflation_data"].get("inflation_rate", "N/A"),
+        "anomaly_block": anomaly_block,
+        "language_instruction": LANGUAGE_INSTRUCTIONS.get(state["language"], LANGUAGE_INSTRUCTIONS["english"]),
+    })
+
+
+def build_coach_prompt(state: AgentState) -> str:
+    """Builds the per-user coach block from spending, projections and RAG context."""
+    country = state["country"]
+    currency = CURRENCY.get(country, "$")
+
+    spending_block = "\n".join(
+        f"- {k}: {currency}{v:,}" for k, v in state["spending"].items() if v > 0
+    )
+
+    projection_block = "\n".join(
+        f"- {k.replace('_', ' ').title()}: {currency}{v.get('future_value', 0):,.0f}"
+        for k, v in state["projections"].get("projections", {}).items()
+    ) or "Projections unavailable"
+
+    # Distinct passages only, each cut at a word boundary to keep the prompt short
+    passages = []
+    seen = set()
+    for k in state["retrieved_knowledge"]:
+        content = k.get("content", "")
+        fingerprint = hash(content[:100])
+        if not content or fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        passages.append(" ".join(content.split()[:KNOWLEDGE_WORDS_PER_PASSAGE]))
+        if len(passages) == KNOWLEDGE_PASSAGES:
+            break
+
+    return COACH_TEMPLATE.format_map({
+        "country_upper": country.upper(),
+        "currency": currency,
+        "monthly_income": state["monthly_income"],
+        "inflation_rate": state["inflation_data"].get("inflation_rate", "N/A"),
+        "framework": BUDGET_FRAMEWORKS.get(country, BUDGET_FRAMEWORKS["us"])[3],
+        "spending_block": spending_block,
+        "projection_block": projection_block,
+        "tax_tip": state["tax_estimate"].get("tip", ""),
+        "knowledge_block": "\n".join(f"- {p}" for p in passages),
+    })
+
+
+def build_rebuilt_budget(country: str, monthly_income: float) -> dict:
+    """Splits income using the country's budget framework."""
+    needs, wants, savings, framework = BUDGET_FRAMEWORKS.get(country, BUDGET_FRAMEWORKS["us"])
+    return {
+        "needs": round(monthly_income * needs, 2),
+        "wants": round(monthly_income * wants, 2),
+        "savings_investments": round(monthly_income * savings, 2),
+        "framework": framework
+    }
+
+
+# ── Node 4: Generate Roast ───────────────────────────────────────────────────
+async def node_generate_roast(state: AgentState) -> AgentState:
+    """
+    Uses LLM to generate a brutally honest, funny roast
+    based on the user's actual spending anomalies and data.
+    In batch mode the prompt is left for run_agent_batch to submit.
+    """
+    print("Node 4: Generating roast...")
+
+    if state.get("batch_mode"):
+        steps = add_step(state, "Generating your financial roast", "Queued for batch generation")
+        return {"steps": steps}
+
+    # Priority tier — the roast is the first thing the user reads
+    roast = await stream_to_writer("generate_roast", smart_client.agenerate_stream(
+        build_roast_prompt(state),
+        max_tokens=ROAST_MAX_TOKENS,
+        tier="priority",
+        system=STATIC_ROAST_PROMPT
+    ))
+
+    steps = add_step(state, "Generating your financial roast", "Roast generated successfully")
+
+    # Runs in parallel with the coach plan node — keys must not overlap
+    return {"roast": roast, "steps": steps}
+
+
+# ── Node 5: Generate Coach Plan ──────────────────────────────────────────────
+async def node_generate_coach_plan(state: AgentState) -> AgentState:
+    """
+    Generates a serious, actionable financial coach plan.
+    In batch mode the prompt is left for run_agent_batch to submit.
+    """
+    print("Node 5: Generating coach plan...")
+
+    rebuilt_budget = build_rebuilt_budget(state["country"], state["monthly_income"])
+
+    if state.get("batch_mode"):
+        steps = add_step(state, "Building your personalized coach plan", "Queued for batch generation")
+        return {"rebuilt_budget": rebuilt_budget, "steps": steps}
+
+    # Flex tier — the heavier call, half price while the user reads the roast
+    coach_plan = await stream_to_writer("generate_coach_plan", smart_client.agenerate_stream(
+        build_coach_prompt(state),
+        max_tokens=COACH_MAX_TOKENS,
+        tier="flex",
+        system=STATIC_COACH_PROMPT
+    ))
 
     steps = add_step(state, "Building your personalized coach plan", "Coach plan ready")
 
+    # Runs in parallel with the roast node — keys must not overlap
     return {
-        **state,
         "coach_plan": coach_plan,
         "rebuilt_budget": rebuilt_budget,
         "steps": steps
-    }
\ No newline at end of file
+    }
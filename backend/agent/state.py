@@ -1,5 +1,17 @@
-from typing import TypedDict, Optional
+from typing import Annotated, TypedDict, Optional
 from datetime import datetime
+import time
+
+
+def merge_steps(existing: list, new: list) -> list:
+    """
+    Reducer for the steps field — appends new steps instead of replacing.
+    Numbers steps in the order they land, so parallel nodes never collide.
+    """
+    merged = list(existing)
+    for step in new:
+        merged.append({**step, "step_number": len(merged) + 1})
+    return merged
 
 
 class AgentState(TypedDict):
@@ -17,6 +29,7 @@ class AgentState(TypedDict):
 
     # ── ML Results ───────────────────────────────────────────────────────────
     anomalies: list                 # flagged spending anomalies
+    anomalies_sorted: list          # anomalous categories only, most anomalous first
     health_score: float             # 0-100 financial health score
     health_grade: str               # A, B, C, D, F
 
@@ -39,17 +52,20 @@ class AgentState(TypedDict):
     rebuilt_budget: dict            # the rebuilt budget breakdown
 
     # ── Agent Reasoning Steps (streamed to frontend) ─────────────────────────
-    steps: list                     # list of AgentStep dicts
+    steps: Annotated[list, merge_steps]  # list of AgentStep dicts
 
     # ── Metadata ────────────────────────────────────────────────────────────
     timestamp: str                  # when analysis started
+    started_monotonic: float        # monotonic clock at start, for step timings
+    batch_mode: bool                # defer LLM calls to one Gemini batch job
     error: Optional[str]            # any error that occurred
 
 
-def create_initial_state(budget_input: dict) -> AgentState:
+def create_initial_state(budget_input: dict, batch_mode: bool = False) -> AgentState:
     """
     Creates the initial state from the user's budget input.
     All fields start empty — the agent fills them in as it reasons.
+    With batch_mode the generation nodes skip their synchronous LLM calls.
     """
     return AgentState(
         # From user input
@@ -60,6 +76,7 @@ def create_initial_state(budget_input: dict) -> AgentState:
 
         # Empty — filled by ML layer
         anomalies=[],
+        anomalies_sorted=[],
         health_score=0.0,
         health_grade="",
 
@@ -86,5 +103,7 @@ def create_initial_state(budget_input: dict) -> AgentState:
 
         # Metadata
         timestamp=datetime.now().isoformat(),
+        started_monotonic=time.monotonic(),
+        batch_mode=batch_mode,
         error=None
     )
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+from functools import cache
+from pathlib import Path
+from dotenv import load_dotenv
+
+
+# ── Environment ──────────────────────────────────────────────────────────────
+# The project .env is resolved and loaded once here — modules import their
+# settings from this file instead of each calling load_dotenv at import
+
+@cache
+def load_env() -> Path:
+    """Loads the project-root .env — later calls are no-ops."""
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+    return env_path
+
+
+load_env()
+
+# ── API Keys ─────────────────────────────────────────────────────────────────
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+FRED_API_KEY = os.getenv("FRED_API_KEY")
+NEWS_API_KEY = os.getenv("NEWS_API_KEY")
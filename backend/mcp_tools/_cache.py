@@ -0,0 +1,33 @@
+from functools import wraps
+from threading import Lock
+from cachetools import TTLCache
+
+
+def ttl_cached(ttl: int, maxsize: int = 8):
+    """
+    Caches an MCP tool's response per argument tuple for ttl seconds.
+    Only successful responses are cached — fallbacks and errors are
+    retried on the next call instead of being served for the whole TTL.
+    Thread-safe, since the agent runs tools in worker threads.
+    """
+    def decorator(func):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        lock = Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            with lock:
+                if key in cache:
+                    return cache[key]
+
+            result = func(*args, **kwargs)
+
+            if result.get("status") == "success":
+                with lock:
+                    cache[key] = result
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
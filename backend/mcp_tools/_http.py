@@ -0,0 +1,30 @@
+import requests_cache
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+# ── Shared HTTP Session ──────────────────────────────────────────────────────
+# One keep-alive connection pool for every MCP tool, so repeat calls to the
+# same API skip the TCP + TLS handshake. requests.Session is thread-safe for
+# plain GETs, which is how the tools are run from the agent.
+#
+# Responses are also cached on disk, so a restart doesn't refetch data that
+# only changes monthly. Only successful responses are stored.
+
+HTTP_TIMEOUT = 5
+
+CACHE_PATH = Path(__file__).resolve().parent.parent / "http_cache"
+
+http_session = requests_cache.CachedSession(
+    str(CACHE_PATH),
+    backend="sqlite",
+    expire_after=60 * 60,
+    urls_expire_after={
+        "api.rbi.org.in": 24 * 60 * 60,      # CPI — published monthly
+        "api.worldbank.org": 24 * 60 * 60,
+        "api.stlouisfed.org": 24 * 60 * 60,
+        "api.mfapi.in": 60 * 60,             # NAVs — published daily
+        "newsapi.org": 30 * 60,              # headlines
+    }
+)
+http_session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+http_session.headers["User-Agent"] = "FinSense/1.0"
@@ -1,9 +1,11 @@
-from pathlib import Path
-from dotenv import load_dotenv
+import math
+import numpy as np
 from datetime import datetime
 
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+
+# Horizons shown in every projection, and the same horizons in months
+PROJECTION_YEARS = (5, 10, 20)
+PROJECTION_MONTHS = np.array([years * 12 for years in PROJECTION_YEARS], dtype=np.float64)
 
 
 def calculate_sip(
@@ -17,31 +19,35 @@ def calculate_sip(
     Used for India — standard way Indians invest in mutual funds.
     Formula: FV = P × ((1 + r)^n - 1) / r × (1 + r)
     """
-    try:
-        monthly_rate = annual_return_rate / 100 / 12
-        total_months = years * 12
+    if monthly_amount <= 0 or years <= 0:
+        return {"error": "monthly_amount and years must be positive", "status": "error"}
 
-        future_value = monthly_amount * (
-            ((1 + monthly_rate) ** total_months - 1) / monthly_rate
-        ) * (1 + monthly_rate)
+    monthly_rate = annual_return_rate / 100 / 12
+    total_months = years * 12
 
-        total_invested = monthly_amount * total_months
-        total_returns = future_value - total_invested
+    total_invested = monthly_amount * total_months
 
-        return {
-            "type": "SIP",
-            "monthly_amount": round(monthly_amount, 2),
-            "years": years,
-            "annual_return_rate": annual_return_rate,
-            "future_value": round(future_value, 2),
-            "total_invested": round(total_invested, 2),
-            "total_returns": round(total_returns, 2),
-            "return_percentage": round((total_returns / total_invested) * 100, 2),
-            "currency": "INR" if country == "india" else "USD",
-            "status": "success"
-        }
-    except Exception as e:
-        return {"error": str(e), "status": "error"}
+    if monthly_rate <= 0:
+        future_value = total_invested  # no growth — just the contributions
+    else:
+        # (1 + r)^n - 1 without the cancellation of subtracting 1 from pow()
+        growth_minus_1 = math.expm1(total_months * math.log1p(monthly_rate))
+        future_value = monthly_amount * growth_minus_1 / monthly_rate * (1.0 + monthly_rate)
+
+    total_returns = future_value - total_invested
+
+    return {
+        "type": "SIP",
+        "monthly_amount": round(monthly_amount, 2),
+        "years": years,
+        "annual_return_rate": annual_return_rate,
+        "future_value": round(future_value, 2),
+        "total_invested": round(total_invested, 2),
+        "total_returns": round(total_returns, 2),
+        "return_percentage": round((total_returns / total_invested) * 100, 2),
+        "currency": "INR" if country == "india" else "USD",
+        "status": "success"
+    }
 
 
 def calculate_compound_interest(
@@ -54,31 +60,35 @@ def calculate_compound_interest(
     Calculates compound interest returns for monthly contributions.
     Used for US — standard way to show index fund / 401k growth.
     """
-    try:
-        monthly_rate = annual_return_rate / 100 / 12
-        total_months = years * 12
+    if monthly_amount <= 0 or years <= 0:
+        return {"error": "monthly_amount and years must be positive", "status": "error"}
 
-        future_value = monthly_amount * (
-            ((1 + monthly_rate) ** total_months - 1) / monthly_rate
-        )
+    monthly_rate = annual_return_rate / 100 / 12
+    total_months = years * 12
 
-        total_invested = monthly_amount * total_months
-        total_returns = future_value - total_invested
+    total_invested = monthly_amount * total_months
 
-        return {
-            "type": "Compound Interest",
-            "monthly_amount": round(monthly_amount, 2),
-            "years": years,
-            "annual_return_rate": annual_return_rate,
-            "future_value": round(future_value, 2),
-            "total_invested": round(total_invested, 2),
-            "total_returns": round(total_returns, 2),
-            "return_percentage": round((total_returns / total_invested) * 100, 2),
-            "currency": "INR" if country == "india" else "USD",
-            "status": "success"
-        }
-    except Exception as e:
-        return {"error": str(e), "status": "error"}
+    if monthly_rate <= 0:
+        future_value = total_invested  # no growth — just the contributions
+    else:
+        # (1 + r)^n - 1 without the cancellation of subtracting 1 from pow()
+        growth_minus_1 = math.expm1(total_months * math.log1p(monthly_rate))
+        future_value = monthly_amount * growth_minus_1 / monthly_rate
+
+    total_returns = future_value - total_invested
+
+    return {
+        "type": "Compound Interest",
+        "monthly_amount": round(monthly_amount, 2),
+        "years": years,
+        "annual_return_rate": annual_return_rate,
+        "future_value": round(future_value, 2),
+        "total_invested": round(total_invested, 2),
+        "total_returns": round(total_returns, 2),
+        "return_percentage": round((total_returns / total_invested) * 100, 2),
+        "currency": "INR" if country == "india" else "USD",
+        "status": "success"
+    }
 
 
 def generate_projections(
@@ -92,12 +102,39 @@ def generate_projections(
     - US S&P 500: ~10% CAGR historically
     """
     annual_rate = 12.0 if country == "india" else 10.0
-    calculator = calculate_sip if country == "india" else calculate_compound_interest
+    monthly_rate = annual_rate / 100 / 12
+    currency = "INR" if country == "india" else "USD"
+
+    # Every horizon at once — same formulas as calculate_sip / calculate_compound_interest
+    growth_minus_1 = np.expm1(PROJECTION_MONTHS * np.log1p(monthly_rate))
+    future_values = monthly_investable * growth_minus_1 / monthly_rate
+    if country == "india":
+        future_values *= 1.0 + monthly_rate  # SIP contributions are made at the start of the month
+    total_invested = monthly_investable * PROJECTION_MONTHS
+    total_returns = future_values - total_invested
+
+    # Round every figure for every horizon in one call
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return_percentages = total_returns / total_invested * 100
+    rounded = np.round(np.stack((future_values, total_invested, total_returns, return_percentages)), 2).T.tolist()
 
     projections = {}
-    for years in [5, 10, 20]:
-        result = calculator(monthly_investable, annual_rate, years, country)
-        projections[f"{years}_years"] = result
+    for years, (future_value, invested, returns, return_percentage) in zip(PROJECTION_YEARS, rounded):
+        if not invested:
+            projections[f"{years}_years"] = {"error": "Nothing to invest", "status": "error"}
+            continue
+        projections[f"{years}_years"] = {
+            "type": "SIP" if country == "india" else "Compound Interest",
+            "monthly_amount": round(monthly_investable, 2),
+            "years": years,
+            "annual_return_rate": annual_rate,
+            "future_value": future_value,
+            "total_invested": invested,
+            "total_returns": returns,
+            "return_percentage": return_percentage,
+            "currency": currency,
+            "status": "success"
+        }
 
     return {
         "country": country,
@@ -120,10 +157,9 @@ def calculate_ppf_returns(
     Lock-in period: 15 years minimum
     """
     ppf_rate = 7.1 / 100
-    total = 0
 
-    for year in range(1, years + 1):
-        total = (total + annual_amount) * (1 + ppf_rate)
+    # Future value of an annuity due — each deposit earns interest from the start of its year
+    total = annual_amount * math.expm1(years * math.log1p(ppf_rate)) / ppf_rate * (1.0 + ppf_rate)
 
     total_invested = annual_amount * years
     total_returns = total - total_invested
@@ -151,32 +187,30 @@ def calculate_hysa_returns(
     Current average HYSA rate: ~4.5% per annum (as of 2026)
     No lock-in period — fully liquid unlike PPF
     """
-    try:
-        annual_rate = 4.5 / 100
-        monthly_rate = annual_rate / 12
-        total_months = years * 12
+    if monthly_amount <= 0 or years <= 0:
+        return {"error": "monthly_amount and years must be positive", "status": "error"}
 
-        future_value = monthly_amount * (
-            ((1 + monthly_rate) ** total_months - 1) / monthly_rate
-        )
+    annual_rate = 4.5 / 100
+    monthly_rate = annual_rate / 12
+    total_months = years * 12
 
-        total_invested = monthly_amount * total_months
-        total_returns = future_value - total_invested
+    future_value = monthly_amount * math.expm1(total_months * math.log1p(monthly_rate)) / monthly_rate
 
-        return {
-            "type": "HYSA",
-            "monthly_amount": round(monthly_amount, 2),
-            "years": years,
-            "annual_rate": 4.5,
-            "future_value": round(future_value, 2),
-            "total_invested": round(total_invested, 2),
-            "total_returns": round(total_returns, 2),
-            "currency": "USD",
-            "note": "HYSA is fully liquid — no lock-in period unlike PPF",
-            "status": "success"
-        }
-    except Exception as e:
-        return {"error": str(e), "status": "error"}
+    total_invested = monthly_amount * total_months
+    total_returns = future_value - total_invested
+
+    return {
+        "type": "HYSA",
+        "monthly_amount": round(monthly_amount, 2),
+        "years": years,
+        "annual_rate": 4.5,
+        "future_value": round(future_value, 2),
+        "total_invested": round(total_invested, 2),
+        "total_returns": round(total_returns, 2),
+        "currency": "USD",
+        "note": "HYSA is fully liquid — no lock-in period unlike PPF",
+        "status": "success"
+    }
 
 
 # ── Quick test ───────────────────────────────────────────────────────────────
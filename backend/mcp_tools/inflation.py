@@ -1,16 +1,22 @@
-import requests
-import os
-from fredapi import Fred
-from dotenv import load_dotenv
 from datetime import datetime
+from pathlib import Path
+import orjson
+import sys
 
-load_dotenv()
+# Add backend to path so the tool also runs standalone
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from config import FRED_API_KEY
+from mcp_tools._http import http_session, HTTP_TIMEOUT
 
 # ── Constants ────────────────────────────────────────────────────────────────
 
 # FRED series ID for US CPI (Consumer Price Index for All Urban Consumers)
 US_CPI_SERIES = "CPIAUCSL"
 
+# FRED observations endpoint — returns plain JSON, newest first with sort_order=desc
+FRED_OBSERVATIONS_URL = "https://api.stlouisfed.org/fred/series/observations"
+
 # MOSPI API endpoint for India CPI data (no key needed — public government data)
 INDIA_CPI_URL = "https://api.data.gov.in/resource/b4e6d07a-af0c-4f8e-9e9e-5f5a0a2a5a2a"
 
@@ -21,26 +27,34 @@ def get_us_inflation() -> dict:
     FRED is the Federal Reserve's official data source.
     """
     try:
-        fred = Fred(api_key=os.getenv("FRED_API_KEY"))
-
-        # Fetch the last 14 months of CPI data to ensure we have 12 months gap
-        cpi_data = fred.get_series(US_CPI_SERIES)
-
-        # Get the two most recent values that are 12 months apart
-        # FRED returns a pandas Series with date index
-        cpi_data = cpi_data.dropna()  # remove any null values
+        # Only the latest 14 readings are needed for the 12 month gap
+        response = http_session.get(
+            FRED_OBSERVATIONS_URL,
+            params={
+                "series_id": US_CPI_SERIES,
+                "api_key": FRED_API_KEY,
+                "file_type": "json",
+                "sort_order": "desc",
+                "limit": 14
+            },
+            timeout=HTTP_TIMEOUT
+        )
+        response.raise_for_status()
+
+        # FRED marks missing readings with "." — skip them
+        observations = [o for o in orjson.loads(response.content)["observations"] if o["value"] != "."]
 
         # Most recent CPI value
-        current_cpi = cpi_data.iloc[-1]
+        current_cpi = float(observations[0]["value"])
 
         # CPI value from exactly 12 months ago
-        cpi_year_ago = cpi_data.iloc[-13]
+        cpi_year_ago = float(observations[12]["value"])
 
         # Year over year inflation rate formula
         inflation_rate = round(((current_cpi - cpi_year_ago) / cpi_year_ago) * 100, 2)
 
         # Get the date of the most recent reading
-        latest_date = cpi_data.index[-1].strftime("%B %Y")
+        latest_date = datetime.strptime(observations[0]["date"], "%Y-%m-%d").strftime("%B %Y")
 
         return {
             "country": "us",
@@ -73,10 +87,10 @@ def get_india_inflation() -> dict:
         # RBI publishes CPI data publicly
         # We fetch the latest available inflation figure
         url = "https://api.rbi.org.in/api/v1/inflation"
-        response = requests.get(url, timeout=5)
+        response = http_session.get(url, timeout=HTTP_TIMEOUT)
 
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             inflation_rate = data.get("cpi_inflation", None)
 
             if inflation_rate:
@@ -95,8 +109,8 @@ def get_india_inflation() -> dict:
         try:
             # World Bank API for India inflation — free, no key
             url = "https://api.worldbank.org/v2/country/IN/indicator/FP.CPI.TOTL.ZG?format=json&mrv=1"
-            response = requests.get(url, timeout=5)
-            data = response.json()
+            response = http_session.get(url, timeout=HTTP_TIMEOUT)
+            data = orjson.loads(response.content)
             inflation_rate = data[1][0]["value"]
 
             if inflation_rate:
@@ -119,17 +133,22 @@ def get_india_inflation() -> dict:
         }
 
 
+# Country → handler, so adding a country doesn't touch the router
+COUNTRY_HANDLERS = {
+    "india": get_india_inflation,
+    "us": get_us_inflation,
+}
+
+
 def get_inflation(country: str) -> dict:
     """
     Main function called by the MCP tool.
     Routes to the right function based on country.
     """
-    if country == "india":
-        return get_india_inflation()
-    elif country == "us":
-        return get_us_inflation()
-    else:
+    handler = COUNTRY_HANDLERS.get(country)
+    if handler is None:
         return {"error": f"Unknown country: {country}"}
+    return handler()
 
 
 # ── Quick test ───────────────────────────────────────────────────────────────
@@ -1,30 +1,105 @@
 import yfinance as yf
-import requests
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+import orjson
+import sys
+
+# Add backend to path so the tool also runs standalone
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from mcp_tools._http import http_session, HTTP_TIMEOUT
+
+# Ticker and fund tables are read-only — they are shared by every request
 
 # ── Indian Market Tickers (NSE/BSE via yfinance) ─────────────────────────────
-INDIA_TICKERS = {
+INDIA_TICKERS = MappingProxyType({
     "Nifty 50":       "^NSEI",
     "Sensex":         "^BSESN",
     "Nifty Bank":     "^NSEBANK",
-}
+})
 
 # ── US Market Tickers ────────────────────────────────────────────────────────
-US_TICKERS = {
+US_INDICES = MappingProxyType({
     "S&P 500":        "^GSPC",
     "Nasdaq":         "^IXIC",
+})
+
+US_ETFS = MappingProxyType({
     "VOO (S&P ETF)":  "VOO",
     "QQQ (Nasdaq ETF)": "QQQ",
     "VTI (Total Market)": "VTI",
-}
+})
+
+US_TICKERS = MappingProxyType({**US_INDICES, **US_ETFS})
 
 # ── Top Indian Mutual Funds via MFAPI ────────────────────────────────────────
-INDIA_FUNDS = {
+INDIA_FUNDS = MappingProxyType({
     "Mirae Asset Large Cap Fund":     "119551",
     "Axis Bluechip Fund":             "120503",
     "Parag Parikh Flexi Cap Fund":    "122639",
     "HDFC Index Fund Nifty 50":       "120716",
-}
+})
+
+
+# Each fund NAV is its own round trip, so they are fetched in parallel
+MAX_FETCH_WORKERS = 8
+
+
+def fetch_prices(tickers: dict, currency: str) -> dict:
+    """
+    Latest price for every ticker in one batched yfinance download,
+    keyed by display name. A few days are requested so markets that
+    haven't traded today still report their last close.
+    """
+    try:
+        closes = yf.download(
+            list(tickers.values()),
+            period="5d",
+            progress=False,
+            threads=True,
+            auto_adjust=False
+        )["Close"].ffill().iloc[-1]
+    except Exception as e:
+        return {name: {"error": str(e)} for name in tickers}
+
+    prices = {}
+    for name, ticker in tickers.items():
+        price = closes.get(ticker)
+        if price is None or price != price:  # missing or NaN — Yahoo had no data
+            prices[name] = {"error": f"No price data for {ticker}"}
+        else:
+            prices[name] = {"price": round(float(price), 2), "currency": currency}
+    return prices
+
+
+def fetch_fund(scheme_code: str) -> dict:
+    """Latest NAV for one mutual fund via MFAPI (free, no key needed)."""
+    try:
+        url = f"https://api.mfapi.in/mf/{scheme_code}/latest"
+        response = http_session.get(url, timeout=HTTP_TIMEOUT)
+        data = orjson.loads(response.content)
+        latest_nav = data["data"][0]  # most recent NAV
+        return {
+            "nav": float(latest_nav["nav"]),
+            "date": latest_nav["date"],
+            "currency": "INR"
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def fetch_status(*groups: dict) -> str:
+    """
+    "success" when every price came back, "partial" when some failed and
+    "error" when all of them did — only a full success is cached.
+    """
+    entries = [entry for group in groups for entry in group.values()]
+    failed = sum("error" in entry for entry in entries)
+    if failed == 0:
+        return "success"
+    return "error" if failed == len(entries) else "partial"
 
 
 def get_india_market_data() -> dict:
@@ -40,33 +115,16 @@ def get_india_market_data() -> dict:
         "status": "success"
     }
 
-    # Fetch index prices via yfinance
-    for name, ticker in INDIA_TICKERS.items():
-        try:
-            data = yf.Ticker(ticker)
-            info = data.fast_info
-            result["indices"][name] = {
-                "price": round(info.last_price, 2),
-                "currency": "INR"
-            }
-        except Exception as e:
-            result["indices"][name] = {"error": str(e)}
-
-    # Fetch mutual fund NAVs via MFAPI (free, no key needed)
-    for fund_name, scheme_code in INDIA_FUNDS.items():
-        try:
-            url = f"https://api.mfapi.in/mf/{scheme_code}"
-            response = requests.get(url, timeout=5)
-            data = response.json()
-            latest_nav = data["data"][0]  # most recent NAV
-            result["mutual_funds"][fund_name] = {
-                "nav": float(latest_nav["nav"]),
-                "date": latest_nav["date"],
-                "currency": "INR"
-            }
-        except Exception as e:
-            result["mutual_funds"][fund_name] = {"error": str(e)}
+    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as pool:
+        # Index prices via one yfinance download, mutual fund NAVs via MFAPI
+        indices = pool.submit(fetch_prices, INDIA_TICKERS, "INR")
+        funds = {name: pool.submit(fetch_fund, code) for name, code in INDIA_FUNDS.items()}
+
+        result["indices"] = indices.result()
+        for fund_name, future in funds.items():
+            result["mutual_funds"][fund_name] = future.result()
 
+    result["status"] = fetch_status(result["indices"], result["mutual_funds"])
     return result
 
 
@@ -83,34 +141,31 @@ def get_us_market_data() -> dict:
         "status": "success"
     }
 
-    # Fetch all US tickers via yfinance
-    for name, ticker in US_TICKERS.items():
-        try:
-            data = yf.Ticker(ticker)
-            info = data.fast_info
-            result["indices" if "^" in ticker else "etfs"][name] = {
-                "price": round(info.last_price, 2),
-                "currency": "USD"
-            }
-        except Exception as e:
-            result["indices" if "^" in ticker else "etfs"][name] = {
-                "error": str(e)
-            }
+    # Fetch all US tickers in one yfinance download
+    prices = fetch_prices(US_TICKERS, "USD")
+    result["indices"] = {name: prices[name] for name in US_INDICES}
+    result["etfs"] = {name: prices[name] for name in US_ETFS}
+    result["status"] = fetch_status(result["indices"], result["etfs"])
 
     return result
 
 
+# Country → handler, so adding a country doesn't touch the router
+COUNTRY_HANDLERS = {
+    "india": get_india_market_data,
+    "us": get_us_market_data,
+}
+
+
 def get_market_data(country: str) -> dict:
     """
     Main function called by the MCP tool.
     Routes to the right function based on country.
     """
-    if country == "india":
-        return get_india_market_data()
-    elif country == "us":
-        return get_us_market_data()
-    else:
+    handler = COUNTRY_HANDLERS.get(country)
+    if handler is None:
         return {"error": f"Unknown country: {country}"}
+    return handler()
 
 
 # ── Quick test — run this file directly to verify it works ──────────────────
@@ -1,12 +1,14 @@
-from newsapi import NewsApiClient
-import os
-from dotenv import load_dotenv
+import re
+import orjson
+import sys
 from pathlib import Path
 from datetime import datetime, timedelta
 
-# Load .env from project root
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+# Add backend to path so the tool also runs standalone
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from config import NEWS_API_KEY
+from mcp_tools._http import http_session, HTTP_TIMEOUT
 
 # ── Keywords ─────────────────────────────────────────────────────────────────
 
@@ -14,31 +16,48 @@ INDIA_KEYWORDS = '"mutual fund" OR "stock market" OR "RBI" OR "SEBI" OR "Nifty"
 
 US_KEYWORDS = '"Federal Reserve" OR "S&P 500" OR "stock market" OR "inflation" OR "401k" OR "personal finance" OR "investing"'
 
+# Headlines mentioning any of these are sports, not finance — one compiled scan per title
+SPORTS_PATTERN = re.compile(
+    r"\b(olympics|basketball|football|soccer|hockey|baseball|nba|nfl|mlb|nhl)\b",
+    re.IGNORECASE
+)
+
+
+# NewsAPI's search endpoint — called directly through the shared session
+NEWS_API_URL = "https://newsapi.org/v2/everything"
+
 
 def get_financial_news(country: str, max_articles: int = 5) -> dict:
     """
     Fetches live financial news headlines filtered by country.
     """
     try:
-        newsapi = NewsApiClient(api_key=os.getenv("NEWS_API_KEY"))
-
-        from_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-        to_date = datetime.now().strftime("%Y-%m-%d")
+        # One clock read for the date window and the response timestamp
+        now = datetime.now()
+        from_date = (now - timedelta(days=7)).strftime("%Y-%m-%d")
+        to_date = now.strftime("%Y-%m-%d")
 
         keywords = INDIA_KEYWORDS if country == "india" else US_KEYWORDS
 
-        response = newsapi.get_everything(
-            q=keywords,
-            language="en",
-            sort_by="relevancy",
-            from_param=from_date,
-            to=to_date,
-            page_size=20
+        response = http_session.get(
+            NEWS_API_URL,
+            params={
+                "q": keywords,
+                "language": "en",
+                "sortBy": "relevancy",
+                "from": from_date,
+                "to": to_date,
+                "pageSize": 20
+            },
+            headers={"X-Api-Key": NEWS_API_KEY},
+            timeout=HTTP_TIMEOUT
         )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
 
         # Clean and filter articles
         articles = []
-        for article in response.get("articles", []):
+        for article in data.get("articles", []):
             title = article.get("title", "")
             description = article.get("description", "")
 
@@ -51,9 +70,7 @@ def get_financial_news(country: str, max_articles: int = 5) -> dict:
                 continue
 
             # Skip clearly non-financial articles
-            sports_keywords = ["olympics", "basketball", "football", "soccer",
-                              "hockey", "baseball", "nba", "nfl", "mlb", "nhl"]
-            if any(kw in title.lower() for kw in sports_keywords):
+            if SPORTS_PATTERN.search(title):
                 continue
 
             articles.append({
@@ -70,7 +87,7 @@ def get_financial_news(country: str, max_articles: int = 5) -> dict:
         return {
             "country": country,
             "articles": articles,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "status": "success"
         }
 
@@ -1,33 +1,29 @@
-from pathlib import Path
-from dotenv import load_dotenv
+import numpy as np
 from datetime import datetime
 
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
 
 # ── India Tax Slabs 2026 ─────────────────────────────────────────────────────
 
 # New Tax Regime (default from FY 2024-25 onwards)
-INDIA_NEW_TAX_SLABS = [
+INDIA_NEW_TAX_SLABS = (
     (300000, 0),      # 0 - 3L: 0%
     (600000, 0.05),   # 3L - 6L: 5%
     (900000, 0.10),   # 6L - 9L: 10%
     (1200000, 0.15),  # 9L - 12L: 15%
     (1500000, 0.20),  # 12L - 15L: 20%
     (float('inf'), 0.30),  # Above 15L: 30%
-]
+)
 
 # Old Tax Regime
-INDIA_OLD_TAX_SLABS = [
+INDIA_OLD_TAX_SLABS = (
     (250000, 0),      # 0 - 2.5L: 0%
     (500000, 0.05),   # 2.5L - 5L: 5%
     (1000000, 0.20),  # 5L - 10L: 20%
     (float('inf'), 0.30),  # Above 10L: 30%
-]
+)
 
 # US Tax Brackets 2026 (Single filer)
-US_TAX_BRACKETS = [
+US_TAX_BRACKETS = (
     (11925, 0.10),
     (48475, 0.12),
     (103350, 0.22),
@@ -35,7 +31,42 @@ US_TAX_BRACKETS = [
     (250525, 0.32),
     (626350, 0.35),
     (float('inf'), 0.37),
-]
+)
+
+
+# ── Slab Lookup Tables ───────────────────────────────────────────────────────
+
+def _slab_table(slabs: tuple) -> tuple:
+    """
+    Turns (upper limit, rate) slabs into arrays for compute_tax:
+    lower bound of each slab, its rate, and the total tax owed on
+    everything below it.
+    """
+    limits = np.array([limit for limit, _ in slabs], dtype=np.float64)
+    rates = np.array([rate for _, rate in slabs], dtype=np.float64)
+    lowers = np.concatenate(([0.0], limits[:-1]))
+    tax_below = np.concatenate(([0.0], np.cumsum((limits[:-1] - lowers[:-1]) * rates[:-1])))
+
+    # Shared by every request — make accidental writes fail loudly
+    for array in (limits, lowers, rates, tax_below):
+        array.flags.writeable = False
+    return limits, lowers, rates, tax_below
+
+
+INDIA_NEW_TAX_TABLE = _slab_table(INDIA_NEW_TAX_SLABS)
+INDIA_OLD_TAX_TABLE = _slab_table(INDIA_OLD_TAX_SLABS)
+US_TAX_TABLE = _slab_table(US_TAX_BRACKETS)
+
+
+def compute_tax(incomes, table: tuple) -> np.ndarray:
+    """
+    Progressive tax on one or more incomes — a binary search for the
+    slab, then the tax below it plus the marginal rate on the rest.
+    """
+    limits, lowers, rates, tax_below = table
+    incomes = np.asarray(incomes, dtype=np.float64)
+    k = np.searchsorted(limits, incomes)
+    return tax_below[k] + (incomes - lowers[k]) * rates[k]
 
 
 def calculate_india_tax(annual_income: float) -> dict:
@@ -43,28 +74,16 @@ def calculate_india_tax(annual_income: float) -> dict:
     Calculates India income tax under both old and new regimes.
     Recommends which regime is better for the user.
     """
-    def compute_tax(income, slabs):
-        tax = 0
-        prev_limit = 0
-        for limit, rate in slabs:
-            if income <= prev_limit:
-                break
-            taxable = min(income, limit) - prev_limit
-            tax += taxable * rate
-            prev_limit = limit
-        return tax
-
-    new_regime_tax = compute_tax(annual_income, INDIA_NEW_TAX_SLABS)
-    old_regime_tax = compute_tax(annual_income, INDIA_OLD_TAX_SLABS)
-
     # Section 80C max deduction
     max_80c = 150000
 
-    # Old regime with 80C deduction
-    old_regime_with_80c = compute_tax(
-        max(0, annual_income - max_80c),
-        INDIA_OLD_TAX_SLABS
-    )
+    new_regime_tax = float(compute_tax(annual_income, INDIA_NEW_TAX_TABLE))
+
+    # Old regime with and without the 80C deduction, in one lookup
+    old_regime_tax, old_regime_with_80c = compute_tax(
+        [annual_income, max(0, annual_income - max_80c)],
+        INDIA_OLD_TAX_TABLE
+    ).tolist()
 
     # Add 4% health and education cess
     new_regime_tax *= 1.04
@@ -92,47 +111,66 @@ def calculate_india_tax(annual_income: float) -> dict:
     }
 
 
-def calculate_us_tax(annual_income: float) -> dict:
+def calculate_us_tax_batch(annual_incomes) -> list:
     """
-    Calculates US federal income tax for single filer.
-    Shows impact of 401k contributions on tax liability.
+    Calculates US federal income tax for single filer across many incomes
+    at once, e.g. for side-by-side scenarios. Every step is a vectorized
+    array operation, so the cost barely grows with the number of incomes.
+    Returns one calculate_us_tax() result per income.
     """
-    def compute_tax(income, brackets):
-        tax = 0
-        prev_limit = 0
-        for limit, rate in brackets:
-            if income <= prev_limit:
-                break
-            taxable = min(income, limit) - prev_limit
-            tax += taxable * rate
-            prev_limit = limit
-        return tax
+    incomes = np.asarray(annual_incomes, dtype=np.float64)
 
     # Standard deduction 2026
     standard_deduction = 14600
-    taxable_income = max(0, annual_income - standard_deduction)
-    base_tax = compute_tax(taxable_income, US_TAX_BRACKETS)
+    taxable_incomes = np.maximum(0.0, incomes - standard_deduction)
 
     # 401k max contribution 2026
     max_401k = 23000
-    income_with_401k = max(0, taxable_income - max_401k)
-    tax_with_401k = compute_tax(income_with_401k, US_TAX_BRACKETS)
-    tax_savings_401k = base_tax - tax_with_401k
+    incomes_with_401k = np.maximum(0.0, taxable_incomes - max_401k)
+
+    base_taxes = compute_tax(taxable_incomes, US_TAX_TABLE)
+    taxes_with_401k = compute_tax(incomes_with_401k, US_TAX_TABLE)
+    savings_401k = base_taxes - taxes_with_401k
+    effective_rates = np.divide(
+        base_taxes * 100, incomes,
+        out=np.zeros_like(incomes), where=incomes > 0
+    )
 
-    return {
-        "country": "us",
-        "annual_income": round(annual_income, 2),
-        "standard_deduction": standard_deduction,
-        "taxable_income": round(taxable_income, 2),
-        "federal_tax": round(base_tax, 2),
-        "tax_with_max_401k": round(tax_with_401k, 2),
-        "tax_savings_401k": round(tax_savings_401k, 2),
-        "max_401k_contribution": max_401k,
-        "effective_rate": round((base_tax / annual_income) * 100, 2),
-        "tip": f"Contributing ${max_401k:,} to 401k saves you ${round(tax_savings_401k):,} in federal taxes",
-        "currency": "USD",
-        "status": "success"
-    }
+    return [
+        {
+            "country": "us",
+            "annual_income": round(income, 2),
+            "standard_deduction": standard_deduction,
+            "taxable_income": round(taxable, 2),
+            "federal_tax": round(base_tax, 2),
+            "tax_with_max_401k": round(tax_with_401k, 2),
+            "tax_savings_401k": round(saving, 2),
+            "max_401k_contribution": max_401k,
+            "effective_rate": round(rate, 2),
+            "tip": f"Contributing ${max_401k:,} to 401k saves you ${round(saving):,} in federal taxes",
+            "currency": "USD",
+            "status": "success"
+        }
+        for income, taxable, base_tax, tax_with_401k, saving, rate in zip(
+            incomes.tolist(), taxable_incomes.tolist(), base_taxes.tolist(),
+            taxes_with_401k.tolist(), savings_401k.tolist(), effective_rates.tolist()
+        )
+    ]
+
+
+def calculate_us_tax(annual_income: float) -> dict:
+    """
+    Calculates US federal income tax for single filer.
+    Shows impact of 401k contributions on tax liability.
+    """
+    return calculate_us_tax_batch([annual_income])[0]
+
+
+# Country → handler, so adding a country doesn't touch the router
+COUNTRY_HANDLERS = {
+    "india": calculate_india_tax,
+    "us": calculate_us_tax,
+}
 
 
 def get_tax_estimate(country: str, annual_income: float) -> dict:
@@ -140,12 +178,10 @@ def get_tax_estimate(country: str, annual_income: float) -> dict:
     Main function called by the MCP tool.
     Routes to the right function based on country.
     """
-    if country == "india":
-        return calculate_india_tax(annual_income)
-    elif country == "us":
-        return calculate_us_tax(annual_income)
-    else:
+    handler = COUNTRY_HANDLERS.get(country)
+    if handler is None:
         return {"error": f"Unknown country: {country}"}
+    return handler(annual_income)
 
 
 # ── Quick test ───────────────────────────────────────────────────────────────
@@ -1,15 +1,19 @@
+import math
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from pathlib import Path
-from dotenv import load_dotenv
-
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
 
 
 # ── Healthy Budget Benchmarks ────────────────────────────────────────────────
+# Read-only — shared by every request, so nothing can rebind a threshold
+
+def _read_only(benchmarks: dict) -> MappingProxyType:
+    """Wraps a benchmark table and each of its rows in a read-only view."""
+    return MappingProxyType({c: MappingProxyType(row) for c, row in benchmarks.items()})
+
 
-INDIA_BENCHMARKS = {
+INDIA_BENCHMARKS = _read_only({
     "rent":          {"ideal": 25, "warning": 35, "critical": 45},
     "food":          {"ideal": 10, "warning": 15, "critical": 20},
     "dining_out":    {"ideal": 5,  "warning": 10, "critical": 15},
@@ -22,9 +26,9 @@ INDIA_BENCHMARKS = {
     "savings":       {"ideal": 20, "warning": 10, "critical": 5},
     "investments":   {"ideal": 10, "warning": 5,  "critical": 0},
     "other":         {"ideal": 5,  "warning": 8,  "critical": 12},
-}
+})
 
-US_BENCHMARKS = {
+US_BENCHMARKS = _read_only({
     "rent":          {"ideal": 28, "warning": 35, "critical": 45},
     "food":          {"ideal": 8,  "warning": 12, "critical": 18},
     "dining_out":    {"ideal": 5,  "warning": 8,  "critical": 12},
@@ -37,80 +41,223 @@ US_BENCHMARKS = {
     "savings":       {"ideal": 15, "warning": 8,  "critical": 3},
     "investments":   {"ideal": 10, "warning": 5,  "critical": 0},
     "other":         {"ideal": 5,  "warning": 8,  "critical": 12},
-}
+})
+
+
+# ── Benchmark Lookup Tables ──────────────────────────────────────────────────
+# The same benchmarks as parallel arrays over one fixed category order, so
+# detection slices arrays instead of doing a dict lookup per category
+
+CATEGORY_ORDER = tuple(INDIA_BENCHMARKS)
+assert CATEGORY_ORDER == tuple(US_BENCHMARKS)
+
+SAVINGS_CATEGORIES = ("savings", "investments")
+SAVINGS_INDEX = CATEGORY_ORDER.index("savings")
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    """Marks a shared lookup array read-only."""
+    array.flags.writeable = False
+    return array
+
+
+def _benchmark_table(benchmarks) -> MappingProxyType:
+    """Builds the array form of one country's benchmarks."""
+    return MappingProxyType({
+        level: _frozen(np.array([benchmarks[c][level] for c in CATEGORY_ORDER], dtype=np.float64))
+        for level in ("ideal", "warning", "critical")
+    })
+
+
+BENCHMARK_TABLES = MappingProxyType({
+    "india": _benchmark_table(INDIA_BENCHMARKS),
+    "us": _benchmark_table(US_BENCHMARKS),
+})
+
+IS_SAVINGS = _frozen(np.array([c in SAVINGS_CATEGORIES for c in CATEGORY_ORDER]))
+
+# Both countries' tables stacked into (country, category) arrays for the
+# batch path — a user's country_idx indexes COUNTRY_INDEX
+COUNTRY_INDEX = ("india", "us")
+STACKED_TABLES = MappingProxyType({
+    level: _frozen(np.stack([BENCHMARK_TABLES[c][level] for c in COUNTRY_INDEX]))
+    for level in ("ideal", "warning", "critical")
+})
+
+
+# Verdict labels indexed by verdict code (0 healthy, 1 warning, 2 critical)
+VERDICTS = ("healthy", "warning", "critical")
+
+# Share of a user's categories flagged as anomalous — the ones deviating
+# most from their benchmarks, like the old IsolationForest's contamination=0.3
+ANOMALY_FRACTION = 0.3
+
+# Robust z-score scale — maps z-scores onto the [-0.5, 0.5] anomaly_score
+MAD_Z_SCALE = 2.5
+
+
+def _flag_count(n_categories: int) -> int:
+    """How many of a user's categories can be flagged as anomalous."""
+    return max(1, math.ceil(ANOMALY_FRACTION * n_categories))
+
 
+@dataclass(frozen=True, slots=True)
+class AnomalyRow:
+    """One category's detection result — immutable, so cached rows can be shared."""
+    category: str
+    amount: float
+    percentage_of_income: float
+    benchmark_percentage: int
+    is_anomalous: bool
+    anomaly_score: float
+    verdict: str  # "healthy", "warning", "critical"
+    currency: str
 
-def detect_anomalies(spending: dict, monthly_income: float, country: str) -> list:
+
+def detect_anomalies(
+    spending: dict,
+    monthly_income: float,
+    country: str,
+    enable_ml: bool = True
+) -> list:
     """
-    Detects anomalous spending categories using Isolation Forest.
+    Detects anomalous spending categories — the top 30% by deviation from
+    their benchmark, as long as the deviation is positive (overspending or
+    undersaving). anomaly_score is a robust (median/MAD) z-score of the
+    same deviation.
     Compares user's spending percentages against healthy benchmarks.
+    With enable_ml=False the scoring is skipped — only the verdicts are
+    computed, critical categories count as anomalous and every
+    anomaly_score is 0.0. Use it when only the verdicts are needed.
+    Results are memoized per input — the rows are frozen, so every caller
+    shares them and only the list is fresh.
     """
-    benchmarks = INDIA_BENCHMARKS if country == "india" else US_BENCHMARKS
+    return list(_detect_anomalies_cached(tuple(spending.items()), float(monthly_income), country, enable_ml))
+
+
+@lru_cache(maxsize=1024)
+def _detect_anomalies_cached(
+    spending_items: tuple,
+    monthly_income: float,
+    country: str,
+    enable_ml: bool
+) -> tuple:
+    """The uncached detection — spending arrives as hashable (category, amount) pairs."""
+    spending = dict(spending_items)
+    table = BENCHMARK_TABLES["india" if country == "india" else "us"]
     currency = "₹" if country == "india" else "$"
 
-    spending_percentages = {}
-    for category, amount in spending.items():
-        spending_percentages[category] = round((amount / monthly_income) * 100, 2)
-
-    deviations = []
-    categories = []
-
-    for category, percentage in spending_percentages.items():
-        if category in benchmarks:
-            ideal = benchmarks[category]["ideal"]
-            if category in ["savings", "investments"]:
-                deviation = ideal - percentage
-            else:
-                deviation = percentage - ideal
-            deviations.append([deviation])
-            categories.append(category)
-
-    if not deviations:
-        return []
-
-    iso_forest = IsolationForest(
-        contamination=0.3,
-        random_state=42,
-        n_estimators=100
-    )
-    predictions = iso_forest.fit_predict(deviations)
-    scores = iso_forest.score_samples(deviations)
+    present = np.fromiter((c in spending for c in CATEGORY_ORDER), dtype=np.bool_, count=len(CATEGORY_ORDER))
+    if not present.any():
+        return ()
+
+    categories = [c for c in CATEGORY_ORDER if c in spending]
+    amounts = np.fromiter((spending[c] for c in categories), dtype=np.float64, count=len(categories))
+    ideals = table["ideal"][present]
+    warnings = table["warning"][present]
+    is_savings = IS_SAVINGS[present]
+    benchmark_percentages = ideals.astype(np.int64).tolist()
+
+    # One sign convention for every category: positive deviation is bad.
+    # For savings/investments that's falling short of the ideal, for
+    # everything else it's spending above it
+    sign = np.where(is_savings, -1.0, 1.0)
+    percentages = np.round(amounts * (100.0 / monthly_income), 2)
+    deviation_values = sign * (percentages - ideals)
+
+    # Branchless verdicts — past the ideal is a warning, past the warning line is critical
+    verdict_codes = (deviation_values > 0).astype(np.int64) + (sign * (percentages - warnings) > 0)
+
+    if enable_ml:
+        # The largest positive deviations are anomalous — a fixed z-score
+        # cut-off flags nothing once several categories deviate and the MAD
+        # grows with them
+        kth = len(deviation_values) - _flag_count(len(deviation_values))
+        cutoff = np.partition(deviation_values, kth)[kth]
+        anomalous = (deviation_values >= cutoff) & (deviation_values > 0)
+
+        # Median/MAD z-score, in the same convention as an Isolation Forest
+        # score: within [-0.5, 0.5], lower means more anomalous
+        median = np.median(deviation_values)
+        mad = np.median(np.abs(deviation_values - median)) + 1e-9
+        z_scores = 0.6745 * (deviation_values - median) / mad
+        scores = -0.5 * np.tanh(z_scores / MAD_Z_SCALE)
+    else:
+        anomalous = verdict_codes == 2
+        scores = np.zeros_like(deviation_values)
+
+    # Critical first, then anomalous — both flags packed into one integer
+    # key; a stable descending argsort keeps category order within ties
+    sort_keys = ((verdict_codes == 2).astype(np.int64) << 1) | anomalous
+    order = np.argsort(-sort_keys, kind="stable")
+
+    # Round and convert each column once — tolist() yields native Python values
+    percentage_values = percentages.tolist()
+    anomalous_flags = anomalous.tolist()
+    score_values = np.round(scores, 4).tolist()
+    verdict_values = verdict_codes.tolist()
 
     results = []
-    for i, category in enumerate(categories):
-        amount = spending.get(category, 0)
-        percentage = spending_percentages.get(category, 0)
-        benchmark = benchmarks[category]
-        is_anomalous = predictions[i] == -1
-
-        if category in ["savings", "investments"]:
-            if percentage >= benchmark["ideal"]:
-                verdict = "healthy"
-            elif percentage >= benchmark["warning"]:
-                verdict = "warning"
-            else:
-                verdict = "critical"
-        else:
-            if percentage <= benchmark["ideal"]:
-                verdict = "healthy"
-            elif percentage <= benchmark["warning"]:
-                verdict = "warning"
-            else:
-                verdict = "critical"
-
-        results.append({
-            "category": category,
-            "amount": amount,
-            "percentage_of_income": percentage,
-            "benchmark_percentage": benchmark["ideal"],
-            "is_anomalous": is_anomalous,
-            "anomaly_score": round(float(scores[i]), 4),
-            "verdict": verdict,
-            "currency": currency
-        })
-
-    results.sort(key=lambda x: (x["verdict"] == "critical", x["is_anomalous"]), reverse=True)
-    return results
+    for i in order.tolist():
+        results.append(AnomalyRow(
+            category=categories[i],
+            amount=spending[categories[i]],
+            percentage_of_income=percentage_values[i],
+            benchmark_percentage=benchmark_percentages[i],
+            is_anomalous=anomalous_flags[i],
+            anomaly_score=score_values[i],
+            verdict=VERDICTS[verdict_values[i]],
+            currency=currency
+        ))
+
+    return tuple(results)
+
+
+def detect_anomalies_batch(
+    spendings: np.ndarray,
+    monthly_incomes: np.ndarray,
+    country_idx: np.ndarray,
+    enable_ml: bool = True
+) -> dict:
+    """
+    Runs detect_anomalies for many users in one NumPy pass.
+    spendings is (N users, C categories) in CATEGORY_ORDER, monthly_incomes
+    is (N,) and country_idx is (N,) indexing COUNTRY_INDEX (0 india, 1 us).
+    Every category counts as present, so a missing one is a zero amount.
+    Returns (N, C) arrays in CATEGORY_ORDER — no per-row sorting.
+    """
+    spendings = np.asarray(spendings, dtype=np.float64)
+    monthly_incomes = np.asarray(monthly_incomes, dtype=np.float64)
+    country_idx = np.asarray(country_idx, dtype=np.intp)
+
+    ideals = STACKED_TABLES["ideal"][country_idx]
+    warnings = STACKED_TABLES["warning"][country_idx]
+
+    # Same sign convention as the single-user path, broadcast over every row
+    sign = np.where(IS_SAVINGS, -1.0, 1.0)
+    percentages = np.round(spendings * (100.0 / monthly_incomes[:, None]), 2)
+    deviation_values = sign * (percentages - ideals)
+    verdict_codes = (deviation_values > 0).astype(np.int8) + (sign * (percentages - warnings) > 0)
+
+    if enable_ml:
+        n = deviation_values.shape[1]
+        cutoffs = np.sort(deviation_values, axis=1)[:, n - _flag_count(n), None]
+        anomalous = (deviation_values >= cutoffs) & (deviation_values > 0)
+
+        median = np.median(deviation_values, axis=1, keepdims=True)
+        mad = np.median(np.abs(deviation_values - median), axis=1, keepdims=True) + 1e-9
+        z_scores = 0.6745 * (deviation_values - median) / mad
+        scores = np.round(-0.5 * np.tanh(z_scores / MAD_Z_SCALE), 4)
+    else:
+        anomalous = verdict_codes == 2
+        scores = np.zeros_like(deviation_values)
+
+    return {
+        "percentage_of_income": percentages,
+        "verdict_codes": verdict_codes,
+        "is_anomalous": anomalous,
+        "anomaly_score": scores
+    }
 
 
 # ── Quick test ───────────────────────────────────────────────────────────────
@@ -137,12 +284,12 @@ if __name__ == "__main__":
     print("=" * 50)
     results_india = detect_anomalies(test_spending_india, 50000, "india")
     for r in results_india:
-        status = "🔴" if r["verdict"] == "critical" else "🟡" if r["verdict"] == "warning" else "🟢"
-        print(f"{status} {r['category']}: ₹{r['amount']:,} ({r['percentage_of_income']}% vs {r['benchmark_percentage']}% ideal) — {r['verdict']}")
+        status = "🔴" if r.verdict == "critical" else "🟡" if r.verdict == "warning" else "🟢"
+        print(f"{status} {r.category}: ₹{r.amount:,} ({r.percentage_of_income}% vs {r.benchmark_percentage}% ideal) — {r.verdict}")
 
-    critical_india = len([r for r in results_india if r["verdict"] == "critical"])
-    warning_india = len([r for r in results_india if r["verdict"] == "warning"])
-    healthy_india = len([r for r in results_india if r["verdict"] == "healthy"])
+    critical_india = len([r for r in results_india if r.verdict == "critical"])
+    warning_india = len([r for r in results_india if r.verdict == "warning"])
+    healthy_india = len([r for r in results_india if r.verdict == "healthy"])
     print(f"\nSummary: 🔴 {critical_india} critical | 🟡 {warning_india} warnings | 🟢 {healthy_india} healthy")
 
     # ── US Test ──────────────────────────────────────────────────────────────
@@ -166,10 +313,10 @@ if __name__ == "__main__":
     print("=" * 50)
     results_us = detect_anomalies(test_spending_us, 5000, "us")
     for r in results_us:
-        status = "🔴" if r["verdict"] == "critical" else "🟡" if r["verdict"] == "warning" else "🟢"
-        print(f"{status} {r['category']}: ${r['amount']:,} ({r['percentage_of_income']}% vs {r['benchmark_percentage']}% ideal) — {r['verdict']}")
+        status = "🔴" if r.verdict == "critical" else "🟡" if r.verdict == "warning" else "🟢"
+        print(f"{status} {r.category}: ${r.amount:,} ({r.percentage_of_income}% vs {r.benchmark_percentage}% ideal) — {r.verdict}")
 
-    critical_us = len([r for r in results_us if r["verdict"] == "critical"])
-    warning_us = len([r for r in results_us if r["verdict"] == "warning"])
-    healthy_us = len([r for r in results_us if r["verdict"] == "healthy"])
+    critical_us = len([r for r in results_us if r.verdict == "critical"])
+    warning_us = len([r for r in results_us if r.verdict == "warning"])
+    healthy_us = len([r for r in results_us if r.verdict == "healthy"])
     print(f"\nSummary: 🔴 {critical_us} critical | 🟡 {warning_us} warnings | 🟢 {healthy_us} healthy")
\ No newline at end of file
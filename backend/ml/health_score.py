@@ -1,8 +1,41 @@
+import numpy as np
+import sys
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
 
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+# Add backend to path so the module also runs standalone
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from ml.anomaly_detector import BENCHMARK_TABLES, CATEGORY_ORDER, STACKED_TABLES
+
+
+# ── Category Groups ──────────────────────────────────────────────────────────
+
+ESSENTIAL_CATEGORIES = ("rent", "food", "transport", "health")
+DISCRETIONARY_CATEGORIES = ("dining_out", "entertainment", "subscriptions", "shopping")
+
+# Masks and positions over the benchmark category order
+ESSENTIAL_MASK = np.array([c in ESSENTIAL_CATEGORIES for c in CATEGORY_ORDER])
+DISCRETIONARY_MASK = np.array([c in DISCRETIONARY_CATEGORIES for c in CATEGORY_ORDER])
+SAVINGS_INDEX = CATEGORY_ORDER.index("savings")
+INVESTMENTS_INDEX = CATEGORY_ORDER.index("investments")
+
+
+# ── Score Tables ─────────────────────────────────────────────────────────────
+
+# Spending as % of income: ≤70 → 10 points, ≤85 → 6, ≤95 → 3, above → 0
+COVERAGE_BINS = np.array([70.0, 85.0, 95.0])
+COVERAGE_SCORES = (10, 6, 3, 0)
+
+# Final score: ≥80 → A, ≥65 → B, ≥50 → C, ≥35 → D, below → F
+GRADE_BINS = np.array([35.0, 50.0, 65.0, 80.0])
+GRADES = (
+    ("F", "Critical financial health — urgent action required"),
+    ("D", "Poor financial health — significant changes needed"),
+    ("C", "Average financial health — some areas need attention"),
+    ("B", "Good financial health with room to improve"),
+    ("A", "Excellent financial health — keep it up!"),
+)
 
 
 def compute_health_score(
@@ -19,15 +52,37 @@ def compute_health_score(
     3. Anomaly penalty (20 points)
     4. Essential vs discretionary ratio (15 points)
     5. Income coverage (10 points)
+    Results are memoized per input — only the anomaly verdicts matter,
+    so they alone go into the cache key.
     """
+    verdicts = tuple(a.verdict for a in anomalies)
+    result = _compute_health_score_cached(tuple(spending.items()), float(monthly_income), verdicts, country)
+    return {**result, "breakdown": {factor: dict(detail) for factor, detail in result["breakdown"].items()}}
+
 
+@lru_cache(maxsize=1024)
+def _compute_health_score_cached(
+    spending_items: tuple,
+    monthly_income: float,
+    verdicts: tuple,
+    country: str
+) -> dict:
+    """The uncached score — inputs arrive as hashable tuples."""
+    spending = dict(spending_items)
     score = 0
     breakdown = {}
 
+    # One pass over the spending dict, then masked reductions
+    values = np.fromiter((spending.get(c, 0) for c in CATEGORY_ORDER), dtype=np.float64, count=len(CATEGORY_ORDER))
+    essential = float(values[ESSENTIAL_MASK].sum())
+    discretionary = float(values[DISCRETIONARY_MASK].sum())
+    total_spending = float(values.sum())
+    savings = float(values[SAVINGS_INDEX])
+    investments = float(values[INVESTMENTS_INDEX])
+
     # ── Factor 1: Savings Rate (30 points) ──────────────────────────────────
-    savings = spending.get("savings", 0)
     savings_rate = (savings / monthly_income) * 100
-    ideal_savings = 20 if country == "india" else 15
+    ideal_savings = int(BENCHMARK_TABLES["india" if country == "india" else "us"]["ideal"][SAVINGS_INDEX])
 
     savings_score = min(30, (savings_rate / ideal_savings) * 30)
     score += savings_score
@@ -40,7 +95,6 @@ def compute_health_score(
     }
 
     # ── Factor 2: Investment Rate (25 points) ────────────────────────────────
-    investments = spending.get("investments", 0)
     investment_rate = (investments / monthly_income) * 100
     ideal_investment = 10
 
@@ -55,8 +109,8 @@ def compute_health_score(
     }
 
     # ── Factor 3: Anomaly Penalty (20 points) ────────────────────────────────
-    critical_count = len([a for a in anomalies if a["verdict"] == "critical"])
-    warning_count = len([a for a in anomalies if a["verdict"] == "warning"])
+    critical_count = verdicts.count("critical")
+    warning_count = verdicts.count("warning")
 
     anomaly_penalty = (critical_count * 4) + (warning_count * 2)
     anomaly_score = max(0, 20 - anomaly_penalty)
@@ -70,11 +124,6 @@ def compute_health_score(
     }
 
     # ── Factor 4: Essential vs Discretionary Ratio (15 points) ──────────────
-    essential = (spending.get("rent", 0) + spending.get("food", 0) +
-                 spending.get("transport", 0) + spending.get("health", 0))
-    discretionary = (spending.get("dining_out", 0) + spending.get("entertainment", 0) +
-                     spending.get("subscriptions", 0) + spending.get("shopping", 0))
-
     if discretionary > 0:
         ratio = essential / (essential + discretionary)
         ratio_score = min(15, ratio * 15)
@@ -91,17 +140,10 @@ def compute_health_score(
     }
 
     # ── Factor 5: Income Coverage (10 points) ────────────────────────────────
-    total_spending = sum(spending.values())
     coverage_rate = (total_spending / monthly_income) * 100
 
-    if coverage_rate <= 70:
-        coverage_score = 10
-    elif coverage_rate <= 85:
-        coverage_score = 6
-    elif coverage_rate <= 95:
-        coverage_score = 3
-    else:
-        coverage_score = 0
+    # side="left" keeps each bin's upper edge inclusive
+    coverage_score = COVERAGE_SCORES[int(np.searchsorted(COVERAGE_BINS, coverage_rate, side="left"))]
 
     score += coverage_score
     breakdown["income_coverage"] = {
@@ -114,21 +156,8 @@ def compute_health_score(
     # ── Final Score ──────────────────────────────────────────────────────────
     final_score = round(min(100, score), 1)
 
-    if final_score >= 80:
-        grade = "A"
-        summary = "Excellent financial health — keep it up!"
-    elif final_score >= 65:
-        grade = "B"
-        summary = "Good financial health with room to improve"
-    elif final_score >= 50:
-        grade = "C"
-        summary = "Average financial health — some areas need attention"
-    elif final_score >= 35:
-        grade = "D"
-        summary = "Poor financial health — significant changes needed"
-    else:
-        grade = "F"
-        summary = "Critical financial health — urgent action required"
+    # side="right" keeps each bin's lower edge inclusive
+    grade, summary = GRADES[int(np.searchsorted(GRADE_BINS, final_score, side="right"))]
 
     return {
         "score": final_score,
@@ -139,10 +168,56 @@ def compute_health_score(
     }
 
 
+def compute_health_score_batch(
+    spendings: np.ndarray,
+    monthly_incomes: np.ndarray,
+    verdict_codes: np.ndarray,
+    country_idx: np.ndarray
+) -> dict:
+    """
+    Scores many users at once — the same 5 factors as compute_health_score,
+    each a broadcast reduction along the category axis.
+    Takes the (N, C) spendings and verdict_codes of detect_anomalies_batch.
+    Returns the (N,) scores and a grade per user, without breakdowns.
+    """
+    spendings = np.asarray(spendings, dtype=np.float64)
+    monthly_incomes = np.asarray(monthly_incomes, dtype=np.float64)
+    verdict_codes = np.asarray(verdict_codes)
+    country_idx = np.asarray(country_idx, dtype=np.intp)
+
+    essential = spendings[:, ESSENTIAL_MASK].sum(axis=1)
+    discretionary = spendings[:, DISCRETIONARY_MASK].sum(axis=1)
+    coverage_rates = spendings.sum(axis=1) / monthly_incomes * 100
+
+    savings_rates = spendings[:, SAVINGS_INDEX] / monthly_incomes * 100
+    ideal_savings = STACKED_TABLES["ideal"][country_idx, SAVINGS_INDEX]
+    savings_scores = np.minimum(30, savings_rates / ideal_savings * 30)
+
+    investment_rates = spendings[:, INVESTMENTS_INDEX] / monthly_incomes * 100
+    investment_scores = np.minimum(25, investment_rates / 10 * 25)
+
+    critical_counts = (verdict_codes == 2).sum(axis=1)
+    warning_counts = (verdict_codes == 1).sum(axis=1)
+    anomaly_scores = np.maximum(0, 20 - (critical_counts * 4 + warning_counts * 2))
+
+    # np.divide with where= skips the users with no discretionary spend
+    ratios = np.divide(essential, essential + discretionary, out=np.ones_like(essential), where=discretionary > 0)
+    ratio_scores = np.minimum(15, ratios * 15)
+
+    coverage_scores = np.asarray(COVERAGE_SCORES)[np.searchsorted(COVERAGE_BINS, coverage_rates, side="left")]
+
+    total = savings_scores + investment_scores + anomaly_scores + ratio_scores + coverage_scores
+    scores = np.round(np.minimum(100, total), 1)
+    grade_indices = np.searchsorted(GRADE_BINS, scores, side="right")
+
+    return {
+        "score": scores,
+        "grade": [GRADES[i][0] for i in grade_indices.tolist()]
+    }
+
+
 # ── Quick test ───────────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    import sys
-    sys.path.append(str(Path(__file__).resolve().parent.parent))
     from ml.anomaly_detector import detect_anomalies
 
     # ── India Test ───────────────────────────────────────────────────────────
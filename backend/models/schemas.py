@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 
+# Schemas are immutable once validated
+FROZEN_CONFIG = ConfigDict(frozen=True)
+
 # ── What the frontend sends to the backend ──────────────────────────────────
 
 class SpendingCategories(BaseModel):
@@ -8,6 +11,8 @@ class SpendingCategories(BaseModel):
     Breakdown of monthly spending across categories.
     All values are in the user's local currency (INR or USD).
     """
+    model_config = FROZEN_CONFIG
+
     rent: float = Field(ge=0, description="Monthly rent or housing cost")
     food: float = Field(ge=0, description="Groceries and home cooking")
     dining_out: float = Field(ge=0, description="Restaurants, Swiggy, Zomato, DoorDash")
@@ -30,6 +35,8 @@ class BudgetInput(BaseModel):
     This structured object is transmitted to the backend API
     when the user submits their budget for AI analysis.
     """
+    model_config = FROZEN_CONFIG
+
     country: str = Field(description="Either 'india' or 'us'")
     monthly_income: float = Field(gt=0, description="Total monthly take-home income")
     spending: SpendingCategories
@@ -41,7 +48,10 @@ class BudgetInput(BaseModel):
 class AnomalyResult(BaseModel):
     """
     Result of ML anomaly detection on a spending category.
+    Built straight from an AnomalyRow with AnomalyResult.model_validate(row).
     """
+    model_config = ConfigDict(**FROZEN_CONFIG, from_attributes=True)
+
     category: str
     amount: float
     percentage_of_income: float
@@ -55,6 +65,8 @@ class InvestmentRecommendation(BaseModel):
     """
     A single investment recommendation with live price data.
     """
+    model_config = FROZEN_CONFIG
+
     name: str
     ticker: Optional[str]
     type: str  # "index_fund", "mutual_fund", "ppf", "fd", "etf"
@@ -75,6 +87,8 @@ financial best-practice frameworks:
 
    The allocation is dynamically selected based on the user's location.
    """
+    model_config = FROZEN_CONFIG
+
     needs: float
     wants: float
     savings_and_investments: float
@@ -86,6 +100,8 @@ class HealthScore(BaseModel):
     """
     Overall financial health score and its breakdown.
     """
+    model_config = FROZEN_CONFIG
+
     score: float  # 0 to 100
     grade: str    # "A", "B", "C", "D", "F"
     breakdown: dict  # what contributed to the score
@@ -106,6 +122,8 @@ including:
 
    This object powers the post-analysis user dashboard experience.
    """
+    model_config = FROZEN_CONFIG
+
     roast: str
     coach_plan: str
     rebuilt_budget: RebuiltBudget
@@ -125,6 +143,8 @@ class AgentStep(BaseModel):
     A single step in the agent's reasoning process.
     Streamed live to the frontend so the user can watch the agent think.
     """
+    model_config = FROZEN_CONFIG
+
     step_number: int
     step_name: str   # e.g. "Fetching inflation rate"
     status: str      # "running", "complete", "error"
@@ -137,6 +157,8 @@ class ChatMessage(BaseModel):
     """
     A message in the follow-up chat interface.
     """
+    model_config = FROZEN_CONFIG
+
     message: str
     country: str
     context: Optional[dict] = None  # the user's budget context for personalized answers
\ No newline at end of file
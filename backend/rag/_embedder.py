@@ -0,0 +1,43 @@
+import os
+import onnxruntime
+from functools import lru_cache
+from sentence_transformers import SentenceTransformer
+
+
+# The model and ONNX export the knowledge base is embedded with — stored in
+# the collection metadata so the retriever can spot an index built by another
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+EMBEDDER_ID = f"{EMBEDDING_MODEL}/{EMBEDDING_ONNX_FILE}"
+
+
+def ort_session_options() -> onnxruntime.SessionOptions:
+    """
+    ONNX Runtime options for the embedder — every graph optimization
+    (layer and attention fusion included), sequential execution, and one
+    intra-op thread per physical core rather than per logical CPU.
+    """
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+    return options
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> SentenceTransformer:
+    """
+    The process-wide embedding model, loaded on first use.
+    Shared by the retriever and the knowledge base builder, so stored chunk
+    vectors and query vectors come from the same pre-quantized int8 ONNX
+    model — and it's only ever loaded once.
+    """
+    return SentenceTransformer(
+        EMBEDDING_MODEL,
+        backend="onnx",
+        model_kwargs={
+            "file_name": EMBEDDING_ONNX_FILE,
+            "provider": "CPUExecutionProvider",
+            "session_options": ort_session_options()
+        }
+    )
@@ -1,15 +1,24 @@
+import argparse
 import chromadb
+import gzip
+import hashlib
 import requests
-from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from selectolax.parser import HTMLParser
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pathlib import Path
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import numpy as np
 
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+# Add backend to path so the script runs standalone
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from rag._embedder import EMBEDDER_ID, get_embedder
 
 # ── Wikipedia Topics ─────────────────────────────────────────────────────────
 
@@ -99,9 +108,70 @@ INVESTOPEDIA_URLS = [
 ]
 
 
+# ── Text Patterns ────────────────────────────────────────────────────────────
+# Compiled once — every fetch and every chunk reuses them
+
+CITATION_PATTERN = re.compile(r'\[.*?\]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+
 # ── Fetchers ─────────────────────────────────────────────────────────────────
 
-def fetch_wikipedia(topic: str) -> str:
+# Fetching is network-bound, so articles are fetched in parallel — capped
+# to stay polite to Wikipedia and Investopedia
+MAX_FETCH_WORKERS = 8
+
+# One keep-alive pool shared by every fetch thread, so each host's TCP + TLS
+# handshake happens once. Transient failures and rate limits are retried
+session = requests.Session()
+session.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+WIKIPEDIA_HEADERS = {"User-Agent": "FinSense-Educational-App/1.0 (Educational project)"}
+
+# Realistic browser headers — Investopedia blocks obvious scrapers
+INVESTOPEDIA_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+# Raw HTML is cached on disk, so re-runs skip the network — refetched after a week
+HTML_CACHE_DIR = Path(__file__).resolve().parent.parent / "html_cache"
+HTML_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+def fetch_html(url: str, headers: dict, refresh: bool = False) -> bytes:
+    """
+    Fetches a page's raw HTML through a gzip'd on-disk cache keyed by URL.
+    The HTML is cached before parsing, so parsing rules can change without
+    re-fetching. refresh=True skips the cache and overwrites the entry.
+    Non-200 responses return b"" and are never cached.
+    """
+    path = HTML_CACHE_DIR / f"{hashlib.sha256(url.encode()).hexdigest()}.html.gz"
+    if not refresh and path.exists() and time.time() - path.stat().st_mtime < HTML_CACHE_TTL:
+        return gzip.decompress(path.read_bytes())
+
+    response = session.get(url, headers=headers, timeout=10)
+    if response.status_code != 200:
+        return b""
+
+    # Write then rename, so an interrupted run never leaves a truncated entry
+    HTML_CACHE_DIR.mkdir(exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    temp_path.write_bytes(gzip.compress(response.content))
+    temp_path.replace(path)
+    return response.content
+
+
+def fetch_wikipedia(topic: str, refresh: bool = False) -> str:
     """
     Fetches full Wikipedia article by scraping HTML directly.
     Gets complete article content instead of just the summary.
@@ -109,28 +179,38 @@ def fetch_wikipedia(topic: str) -> str:
     try:
         clean_topic = topic.replace("%26", "%26").replace(" ", "_")
         url = f"https://en.wikipedia.org/wiki/{clean_topic}"
-        headers = {"User-Agent": "FinSense-Educational-App/1.0 (Educational project)"}
-        response = requests.get(url, headers=headers, timeout=10)
+        html = fetch_html(url, WIKIPEDIA_HEADERS, refresh)
 
-        if response.status_code != 200:
+        if not html:
             return ""
 
-        soup = BeautifulSoup(response.content, "html.parser")
-        content_div = soup.find("div", {"id": "mw-content-text"})
+        tree = HTMLParser(html)
+        content_div = tree.css_first("div#mw-content-text")
         if not content_div:
             return ""
 
-        paragraphs = content_div.find_all("p")
+        paragraphs = content_div.css("p")
         text_parts = []
+        total_length = 0
         for p in paragraphs[:20]:
-            text = p.get_text()
-            text = re.sub(r'\[.*?\]', '', text)
-            text = re.sub(r'\s+', ' ', text).strip()
+            text = p.text()
+
+            # Cleaning only shortens the text, so short paragraphs skip the regexes
+            if len(text) <= 50:
+                continue
+
+            text = CITATION_PATTERN.sub('', text)
+            text = WHITESPACE_PATTERN.sub(' ', text).strip()
             if len(text) > 50:
                 text_parts.append(text)
+                total_length += len(text)
+
+                # Anything further would be cut off by the 6000-character slice
+                if total_length >= 6000:
+                    break
 
+        # Each part is already collapsed and stripped
         full_text = " ".join(text_parts)
-        full_text = re.sub(r'\s+', ' ', full_text).strip()
         return full_text[:6000] if len(full_text) > 300 else ""
 
     except Exception as e:
@@ -138,37 +218,30 @@ def fetch_wikipedia(topic: str) -> str:
         return ""
 
 
-def fetch_investopedia(url: str) -> str:
+def fetch_investopedia(url: str, refresh: bool = False) -> str:
     """Fetches article text from Investopedia with realistic browser headers."""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1",
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.content, "html.parser")
+        html = fetch_html(url, INVESTOPEDIA_HEADERS, refresh)
+        if not html:
+            return ""
+
+        tree = HTMLParser(html)
 
-        for tag in soup(["script", "style", "nav", "footer",
-                         "header", "aside", "form", "button"]):
+        for tag in tree.css("script, style, nav, footer, header, aside, form, button"):
             tag.decompose()
 
-        article = (soup.find("article") or
-                   soup.find("div", {"id": "article-body"}) or
-                   soup.find("div", {"class": re.compile("article-body")}) or
-                   soup.find("div", {"class": re.compile("comp-article")}) or
-                   soup.find("main"))
+        article = (tree.css_first("article") or
+                   tree.css_first("div#article-body") or
+                   tree.css_first('div[class*="article-body"]') or
+                   tree.css_first('div[class*="comp-article"]') or
+                   tree.css_first("main"))
 
         if article:
-            text = article.get_text(separator="\n")
+            text = article.text(separator="\n")
         else:
-            text = soup.get_text(separator="\n")
+            text = tree.text(separator="\n")
 
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = WHITESPACE_PATTERN.sub(' ', text).strip()
         return text[:6000] if len(text) > 500 else ""
 
     except Exception as e:
@@ -178,54 +251,77 @@ def fetch_investopedia(url: str) -> str:
 
 # ── Semantic Chunking ─────────────────────────────────────────────────────────
 
-def semantic_chunk(text: str, embedder: SentenceTransformer) -> list:
-    """Semantic chunking — splits text at points where meaning changes."""
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    sentences = [s.strip() for s in sentences if len(s.strip()) > 20]
+def split_sentences(text: str) -> list:
+    """Splits text into the sentences semantic chunking works on."""
+    sentences = SENTENCE_BOUNDARY_PATTERN.split(text)
+    return [s.strip() for s in sentences if len(s.strip()) > 20]
 
-    if len(sentences) < 3:
-        return [text] if len(text) > 100 else []
 
-    embeddings = embedder.encode(sentences)
+def mean_pool(embeddings: np.ndarray, chunk_ranges: list) -> np.ndarray:
+    """
+    L2-normalized mean of each chunk's sentence embeddings, for every chunk
+    at once. chunk_ranges holds each chunk's [start, end) sentence ranges —
+    the member rows are gathered into one array and summed per chunk with a
+    single np.add.reduceat.
+    """
+    counts = np.array([sum(end - start for start, end in ranges) for ranges in chunk_ranges])
+    rows = np.concatenate([np.arange(start, end) for ranges in chunk_ranges for start, end in ranges])
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    pooled = np.add.reduceat(embeddings[rows], offsets, axis=0) / counts[:, None]
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
 
-    def cosine_similarity(a, b):
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def semantic_chunk(text: str, sentences: list, embeddings: np.ndarray) -> list:
+    """
+    Semantic chunking — splits text at points where meaning changes.
+    Takes the text's sentences and their L2-normalized embeddings, which
+    are encoded for every document in one batch before chunking.
+    Returns (chunk, embedding) pairs — each chunk's embedding is pooled
+    from its sentences, or None when the chunk still has to be encoded.
+    """
+    if len(sentences) < 3:
+        return [(text, None)] if len(text) > 100 else []
 
-    similarities = []
-    for i in range(len(embeddings) - 1):
-        sim = cosine_similarity(embeddings[i], embeddings[i + 1])
-        similarities.append(sim)
+    # Embeddings are L2-normalized, so each neighbour's cosine similarity
+    # is just a row-wise dot product
+    similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
 
     threshold = np.percentile(similarities, 25)
-    split_points = [i + 1 for i, sim in enumerate(similarities) if sim < threshold]
+    split_points = (np.flatnonzero(similarities < threshold) + 1).tolist()
 
+    # Each chunk keeps the sentence range it was built from
     chunks = []
     prev = 0
-    for split in split_points:
+    for split in split_points + [len(sentences)]:
         chunk_text = " ".join(sentences[prev:split])
         if len(chunk_text) > 100:
-            chunks.append(chunk_text)
+            chunks.append((chunk_text, prev, split))
         prev = split
 
-    final_chunk = " ".join(sentences[prev:])
-    if len(final_chunk) > 100:
-        chunks.append(final_chunk)
-
     merged_chunks = []
     buffer = ""
-    for chunk in chunks:
+    ranges = []
+    for chunk, start, end in chunks:
         buffer = (buffer + " " + chunk).strip()
+        ranges.append((start, end))
         if len(buffer.split()) >= 100:
-            merged_chunks.append(buffer)
+            merged_chunks.append((buffer, ranges))
             buffer = ""
+            ranges = []
 
     if buffer and len(buffer) > 100:
         if merged_chunks:
-            merged_chunks[-1] += " " + buffer
+            last_chunk, last_ranges = merged_chunks[-1]
+            merged_chunks[-1] = (last_chunk + " " + buffer, last_ranges + ranges)
         else:
-            merged_chunks.append(buffer)
+            merged_chunks.append((buffer, ranges))
 
-    return merged_chunks
+    if not merged_chunks:
+        return []
+
+    chunk_embeddings = mean_pool(embeddings, [ranges for _, ranges in merged_chunks])
+    return [(chunk, embedding) for (chunk, _), embedding in zip(merged_chunks, chunk_embeddings)]
 
 
 def recursive_chunk(text: str) -> list:
@@ -240,18 +336,21 @@ def recursive_chunk(text: str) -> list:
     return [c for c in chunks if len(c) > 100]
 
 
-def smart_chunk(text: str, embedder: SentenceTransformer) -> list:
-    """Semantic first, recursive fallback."""
-    semantic_chunks = semantic_chunk(text, embedder)
-    if len(semantic_chunks) < 3 and len(text) > 1000:
-        return recursive_chunk(text)
-    return semantic_chunks if semantic_chunks else recursive_chunk(text)
+def smart_chunk(text: str, sentences: list, embeddings: np.ndarray) -> list:
+    """Semantic first, recursive fallback — (chunk, embedding or None) pairs."""
+    semantic_chunks = semantic_chunk(text, sentences, embeddings)
+    if semantic_chunks and not (len(semantic_chunks) < 3 and len(text) > 1000):
+        return semantic_chunks
+    return [(chunk, None) for chunk in recursive_chunk(text)]
 
 
 # ── Build Knowledge Base ──────────────────────────────────────────────────────
 
-def build_knowledge_base():
-    """Builds ChromaDB knowledge base from Wikipedia + Investopedia."""
+def build_knowledge_base(refresh: bool = False):
+    """
+    Builds ChromaDB knowledge base from Wikipedia + Investopedia.
+    Pages come from the HTML cache when fresh — refresh=True re-fetches all.
+    """
     print("=" * 60)
     print("Building FinSense RAG Knowledge Base")
     print("Chunking: Semantic + Recursive fallback")
@@ -267,101 +366,139 @@ def build_knowledge_base():
     except Exception:
         pass
 
+    # Cosine space over the unit-length embeddings, with the HNSW graph
+    # tuned for recall since it's built once from a single bulk write
     collection = chroma_client.create_collection(
         name="financial_literacy",
-        metadata={"description": "FinSense real-time financial knowledge base"}
+        metadata={
+            "description": "FinSense real-time financial knowledge base",
+            "embedder": EMBEDDER_ID,
+            "hnsw:space": "cosine",
+            "hnsw:construction_ef": 200,
+            "hnsw:M": 32
+        }
     )
 
     print("Loading embedding model...")
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
+    embedder = get_embedder()
     print("Model loaded\n")
 
-    all_chunks = []
-    all_metadatas = []
-    all_ids = []
-    doc_id = 0
-    success_count = 0
-
-    # ── Wikipedia ────────────────────────────────────────────────────────────
-    print("── Wikipedia Articles ──")
-    for topic, country in INDIA_WIKIPEDIA_TOPICS:
-        display = topic.replace("_", " ").replace("%26", "&")
-        print(f"  Fetching: {display}...")
-        content = fetch_wikipedia(topic)
-
-        if content and len(content) > 300:
-            chunks = smart_chunk(content, embedder)
-            for j, chunk in enumerate(chunks):
-                all_chunks.append(chunk)
-                all_metadatas.append({
+    # Fetched documents as (content, metadata, id prefix) — chunked together below
+    documents = []
+
+    print(f"Fetching {len(INDIA_WIKIPEDIA_TOPICS) + len(INVESTOPEDIA_URLS)} articles...\n")
+    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as pool:
+        # Both sources are queued up front; results come back in list order
+        wiki_pages = pool.map(partial(fetch_wikipedia, refresh=refresh), [topic for topic, _ in INDIA_WIKIPEDIA_TOPICS])
+        investo_pages = pool.map(partial(fetch_investopedia, refresh=refresh), [item["url"] for item in INVESTOPEDIA_URLS])
+
+        # ── Wikipedia ────────────────────────────────────────────────────────
+        print("── Wikipedia Articles ──")
+        for (topic, country), content in zip(INDIA_WIKIPEDIA_TOPICS, wiki_pages):
+            display = topic.replace("_", " ").replace("%26", "&")
+
+            if content and len(content) > 300:
+                documents.append((content, {
                     "title": display,
                     "country": country,
                     "source": "Wikipedia",
                     "type": "wikipedia"
-                })
-                all_ids.append(f"wiki_{doc_id}_{j}")
-            doc_id += 1
-            success_count += 1
-            print(f"  ✅ {len(chunks)} semantic chunks — {display}")
-        else:
-            print(f"  ⚠️ Skipped — {display}")
-
-    # ── Investopedia ─────────────────────────────────────────────────────────
-    print("\n── Investopedia Articles ──")
-    for item in INVESTOPEDIA_URLS:
-        print(f"  Fetching: {item['title']}...")
-        content = fetch_investopedia(item["url"])
-
-        if content and len(content) > 300:
-            chunks = smart_chunk(content, embedder)
-            for j, chunk in enumerate(chunks):
-                all_chunks.append(chunk)
-                all_metadatas.append({
+                }, "wiki"))
+                print(f"  ✅ Fetched — {display}")
+            else:
+                print(f"  ⚠️ Skipped — {display}")
+
+        # ── Investopedia ─────────────────────────────────────────────────────
+        print("\n── Investopedia Articles ──")
+        for item, content in zip(INVESTOPEDIA_URLS, investo_pages):
+            if content and len(content) > 300:
+                documents.append((content, {
                     "title": item["title"],
                     "country": item["country"],
                     "source": "Investopedia",
                     "type": "investopedia"
-                })
-                all_ids.append(f"investo_{doc_id}_{j}")
-            doc_id += 1
-            success_count += 1
-            print(f"  ✅ {len(chunks)} semantic chunks — {item['title']}")
-        else:
-            print(f"  ⚠️ Skipped — {item['title']}")
+                }, "investo"))
+                print(f"  ✅ Fetched — {item['title']}")
+            else:
+                print(f"  ⚠️ Skipped — {item['title']}")
 
-    if not all_chunks:
+    if not documents:
         print("\n❌ No content fetched — check internet connection")
         return
 
-    # ── Generate Embeddings and Store ────────────────────────────────────────
-    print(f"\nGenerating embeddings for {len(all_chunks)} chunks...")
-    batch_size = 64
+    # ── Semantic Chunking ────────────────────────────────────────────────────
+    # Every document's sentences go through the model in one encode() call,
+    # then each document chunks on its own slice of the embeddings
+    doc_sentences = [split_sentences(content) for content, _, _ in documents]
+    all_sentences = [s for sentences in doc_sentences for s in sentences]
+
+    print(f"\nEmbedding {len(all_sentences)} sentences from {len(documents)} documents...")
+    sentence_embeddings = embedder.encode(
+        all_sentences,
+        batch_size=256,
+        show_progress_bar=True,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    )
+
+    all_chunks = []
     all_embeddings = []
+    all_metadatas = []
+    all_ids = []
+    offset = 0
 
-    for i in range(0, len(all_chunks), batch_size):
-        batch = all_chunks[i:i + batch_size]
-        embeddings = embedder.encode(batch, show_progress_bar=False).tolist()
-        all_embeddings.extend(embeddings)
-        print(f"  Embedded {min(i + batch_size, len(all_chunks))}/{len(all_chunks)}")
+    for doc_id, ((content, metadata, prefix), sentences) in enumerate(zip(documents, doc_sentences)):
+        embeddings = sentence_embeddings[offset:offset + len(sentences)]
+        offset += len(sentences)
+
+        chunks = smart_chunk(content, sentences, embeddings)
+        for j, (chunk, embedding) in enumerate(chunks):
+            all_chunks.append(chunk)
+            all_embeddings.append(embedding)
+            all_metadatas.append(metadata)
+            all_ids.append(f"{prefix}_{doc_id}_{j}")
+        print(f"  ✅ {len(chunks)} semantic chunks — {metadata['title']}")
+
+    if not all_chunks:
+        print("\n❌ No chunks produced from the fetched content")
+        return
+
+    # ── Generate Embeddings and Store ────────────────────────────────────────
+    # Semantic chunks reuse their pooled sentence embeddings — only the
+    # recursive fallback chunks go through the model again
+    missing = [i for i, embedding in enumerate(all_embeddings) if embedding is None]
+    if missing:
+        print(f"\nGenerating embeddings for {len(missing)} fallback chunks...")
+        fallback_embeddings = embedder.encode(
+            [all_chunks[i] for i in missing],
+            batch_size=256,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        for i, embedding in zip(missing, fallback_embeddings):
+            all_embeddings[i] = embedding
 
     collection.add(
         documents=all_chunks,
-        embeddings=all_embeddings,
+        embeddings=np.stack(all_embeddings).astype(np.float32),
         metadatas=all_metadatas,
         ids=all_ids
     )
 
     print(f"\n{'=' * 60}")
     print(f"✅ Knowledge Base Built Successfully!")
-    print(f"   Documents processed: {success_count}")
+    print(f"   Documents processed: {len(documents)}")
     print(f"   Total chunks stored: {len(all_chunks)}")
     print(f"   India chunks: {len([m for m in all_metadatas if m['country'] in ['india', 'both']])}")
     print(f"   US chunks: {len([m for m in all_metadatas if m['country'] in ['us', 'both']])}")
     print(f"   Chunking method: Semantic + Recursive fallback")
     print(f"   Stored in: backend/chroma_db/")
     print(f"{'=' * 60}")
-    print("\nRe-run anytime to refresh with latest content!")
+    print("\nRe-run with --refresh to re-fetch the latest content!")
 
 
 if __name__ == "__main__":
-    build_knowledge_base()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the FinSense RAG knowledge base")
+    parser.add_argument("--refresh", action="store_true", help="re-fetch every page instead of using the HTML cache")
+    build_knowledge_base(refresh=parser.parse_args().refresh)
\ No newline at end of file
@@ -1,16 +1,77 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
+import numpy as np
+import sys
+from functools import lru_cache
+from cachetools import TTLCache
+from threading import Lock
 from pathlib import Path
-from dotenv import load_dotenv
 
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+# Add backend to path so the module also runs standalone
+sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-# ── Initialize ChromaDB and Embedder ─────────────────────────────────────────
+from rag._embedder import EMBEDDER_ID, get_embedder
+
+# ── Initialize ChromaDB ──────────────────────────────────────────────────────
+# The embedder is loaded on first search — see rag._embedder
 
 chroma_path = Path(__file__).resolve().parent.parent / "chroma_db"
 chroma_client = chromadb.PersistentClient(path=str(chroma_path))
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+
+
+def open_collection():
+    """
+    Looks up the knowledge base collection and warns when it was embedded
+    with a different model than the one queries use — its scores and
+    rankings are off until the index is rebuilt with rag/build_kb.py.
+    """
+    collection = chroma_client.get_collection("financial_literacy")
+    index_embedder = (collection.metadata or {}).get("embedder")
+    if index_embedder != EMBEDDER_ID:
+        print(
+            f"  ⚠️ Knowledge base was embedded with {index_embedder or 'an unknown model'}, "
+            f"queries use {EMBEDDER_ID} — rerun rag/build_kb.py to rebuild it"
+        )
+    return collection
+
+
+# Collection handle looked up once at import — None until the knowledge
+# base is built, in which case the first successful search fills it in
+try:
+    knowledge_collection = open_collection()
+except Exception:
+    knowledge_collection = None
+
+# Cosine similarity from a Chroma distance, per index space — the stored
+# and query vectors are unit length, so squared L2 is 2 - 2cos and the
+# cosine and inner-product distances are both 1 - cos
+DISTANCE_TO_SIMILARITY = {
+    "cosine": lambda dist: 1 - dist,
+    "ip": lambda dist: 1 - dist,
+    "l2": lambda dist: 1 - dist / 2,
+}
+
+# Country filters built once — each includes "both" tagged content always
+COUNTRY_FILTERS = {
+    country: {
+        "$or": [
+            {"country": {"$eq": country}},
+            {"country": {"$eq": "both"}}
+        ]
+    }
+    for country in ("india", "us")
+}
+
+# ── Retrieval Cache ──────────────────────────────────────────────────────────
+# Users with the same anomaly categories produce the same query, so results
+# are reused for an hour instead of re-embedding and re-searching each time
+
+retrieval_cache = TTLCache(maxsize=1024, ttl=60 * 60)
+retrieval_cache_lock = Lock()
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases and collapses whitespace so equivalent queries share a cache key."""
+    return " ".join(query.lower().split())
 
 
 def retrieve_knowledge(
@@ -22,6 +83,7 @@ def retrieve_knowledge(
     Retrieves the most relevant financial knowledge chunks for a query.
     Filters by country so India users get India-relevant advice
     and US users get US-relevant advice.
+    Results are cached per (normalized query, country, n_results).
 
     Args:
         query: The question or topic to search for
@@ -31,23 +93,53 @@ def retrieve_knowledge(
     Returns:
         List of dicts with content, title, source, country
     """
+    key = (normalize_query(query), country, n_results)
+    with retrieval_cache_lock:
+        cached = retrieval_cache.get(key)
+    if cached is not None:
+        return cached
+
+    knowledge = search_knowledge(key[0], country, n_results)
+
+    # Don't cache failures — an empty result is retried next time
+    if knowledge:
+        with retrieval_cache_lock:
+            retrieval_cache[key] = knowledge
+    return knowledge
+
+
+@lru_cache(maxsize=512)
+def embed_query(query: str) -> bytes:
+    """
+    Embeds a normalized query, memoized so a repeated query skips the model
+    even after its retrieval results expire. Returned as float32 bytes,
+    so the cached value is immutable.
+    """
+    return get_embedder().encode(query, normalize_embeddings=True).astype(np.float32).tobytes()
+
+
+def get_collection():
+    """Returns the knowledge base collection, reusing the handle once found."""
+    global knowledge_collection
+    if knowledge_collection is None:
+        knowledge_collection = open_collection()
+    return knowledge_collection
+
+
+def search_knowledge(query: str, country: str, n_results: int) -> list:
+    """Embeds the query and searches ChromaDB — the uncached retrieval path."""
     try:
-        collection = chroma_client.get_collection("financial_literacy")
+        collection = get_collection()
+        to_similarity = DISTANCE_TO_SIMILARITY[(collection.metadata or {}).get("hnsw:space", "l2")]
 
-        # Embed the query
-        query_embedding = embedder.encode(query).tolist()
+        # Embed the query — a (1, dim) float32 view over the cached bytes — Chroma takes it as is
+        query_embeddings = np.frombuffer(embed_query(query), dtype=np.float32).reshape(1, -1)
 
-        # Filter by country — include "both" tagged content always
-        where_filter = {
-            "$or": [
-                {"country": {"$eq": country}},
-                {"country": {"$eq": "both"}}
-            ]
-        }
+        where_filter = COUNTRY_FILTERS.get(country, COUNTRY_FILTERS["us"])
 
         # Search ChromaDB
         results = collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=n_results,
             where=where_filter,
             include=["documents", "metadatas", "distances"]
@@ -61,7 +153,7 @@ def retrieve_knowledge(
 
         for doc, meta, dist in zip(documents, metadatas, distances):
             # Convert distance to similarity score (lower distance = higher similarity)
-            similarity = round(1 - dist, 4)
+            similarity = round(to_similarity(dist), 4)
 
             knowledge.append({
                 "content": doc,
@@ -71,8 +163,7 @@ def retrieve_knowledge(
                 "similarity": similarity
             })
 
-        # Sort by similarity — most relevant first
-        knowledge.sort(key=lambda x: x["similarity"], reverse=True)
+        # Chroma returns results ordered by distance ascending — most relevant first
         return knowledge
 
     except Exception as e:
@@ -99,7 +190,8 @@ def retrieve_for_anomalies(
     worst = (critical + warning)[:3]
 
     if worst:
-        categories = [a["category"].replace("_", " ") for a in worst]
+        # Deduplicated and sorted, so any order of the same categories is one cache key
+        categories = sorted({a["category"].replace("_", " ") for a in worst})
         query = f"budgeting advice overspending {' '.join(categories)} savings investment"
     else:
         query = "budgeting savings investment personal finance"
@@ -0,0 +1,23 @@
+import json
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from ml.anomaly_detector import detect_anomalies
+
+BUDGETS_PATH = Path(__file__).resolve().parent / "test_budgets.json"
+
+
+def test_fixture_budgets_flag_anomalies():
+    """Both fixture budgets overspend on dining out and undersave — both must be flagged."""
+    for budget in json.loads(BUDGETS_PATH.read_text(encoding="utf-8")):
+        anomalies = detect_anomalies(budget["spending"], budget["monthly_income"], budget["country"])
+        flagged = {a.category for a in anomalies if a.is_anomalous}
+
+        assert {"dining_out", "savings"} <= flagged, (budget["country"], flagged)
+        assert len(flagged) <= 4, (budget["country"], flagged)
+
+
+if __name__ == "__main__":
+    test_fixture_budgets_flag_anomalies()
+    print("✅ Fixture budgets flag dining_out and savings")